@@ -1,10 +1,18 @@
 # app.py
 import streamlit as st
-import base64     
 from datetime import datetime, timedelta
 import random
+import functools
 from utils.auth import*
 from utils.email_sender import*
+from utils.ids import new_booking_id, trip_bus_number, trip_driver_number
+from utils.seats import seat_holds, trip_key
+from utils.assets import asset_url, stylesheet_html
+from utils.seat_map import seat_map
+from utils.coupon_panel import coupon_panel
+from utils.discounts import active_discounts, check_discount, redeem_discount, release_discount
+from utils.mail_queue import mail_configured, mail_queue
+import uuid
 
 # Page configuration
 st.set_page_config(
@@ -14,172 +22,14 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- CSS for two-deck sleeper style seats ---
-st.markdown("""
-<style>
-/* Page & header */
-.header {
-    text-align: center;
-    padding: 18px;
-    background: linear-gradient(135deg,#667eea 0%,#764ba2 100%);
-    color: white;
-    border-radius: 12px;
-    margin-bottom: 18px;
-}
-
-/* Deck container (default desktop layout) */
-.deck-container {
-    display: flex;
-    gap: 18px;
-    align-items: flex-start;
-    width: 100%;
-}
-
-/* Each deck card */
-.deck {
-    background: #ffffff;
-    padding: 14px;
-    border-radius: 12px;
-    box-shadow: 0 6px 18px rgba(0,0,0,0.06);
-    flex: 1 1 0;
-    min-width: 0; /* allow flex to shrink */
-}
-
-/* Deck title row */
-.deck-title {
-    display:flex;
-    align-items:center;
-    justify-content:space-between;
-    margin-bottom:10px;
-}
-.deck-title h3 {
-    margin:0;
-    font-size:18px;
-}
-
-/* Seat grid */
-.seat-row {
-    display:flex;
-    gap:16px;
-    margin-bottom:12px;
-    align-items:flex-start;
-}
-
-/* Seat container (holds price bubble + seat box + button) */
-.seat-wrap {
-    display:flex;
-    flex-direction:column;
-    align-items:center;
-    width:90px;
-}
-
-/* Price bubble */
-.price-bubble {
-    font-size:12px;
-    padding:6px 8px;
-    border-radius:12px;
-    background:linear-gradient(90deg,#4facfe 0%,#00f2fe 100%);
-    color:white;
-    margin-bottom:6px;
-    box-shadow: 0 4px 10px rgba(0,0,0,0.08);
-}
-
-/* Sleeper seat rectangle */
-.seat-rect {
-    width:78px;
-    height:110px;
-    border-radius:10px;
-    display:flex;
-    align-items:center;
-    justify-content:center;
-    font-weight:700;
-    font-size:18px;
-    box-shadow: 0 4px 10px rgba(0,0,0,0.06);
-    position:relative;
-}
-
-/* Sold overlay */
-.sold-overlay {
-    position:absolute;
-    inset:0;
-    background:rgba(235,235,235,0.85);
-    display:flex;
-    align-items:center;
-    justify-content:center;
-    border-radius:10px;
-    font-weight:700;
-    color:#9a9a9a;
-}
-
-/* Gender & states */
-.seat-male {
-    background: linear-gradient(180deg,#2ecc71, #28a745);
-    color:white;
-    border: 3px solid rgba(0,0,0,0.04);
-}
-
-.seat-female {
-    background: linear-gradient(180deg,#ff9acb,#ff6aa6);
-    color:white;
-    border: 3px solid rgba(0,0,0,0.04);
-}
-
-.seat-selected {
-    background: linear-gradient(180deg,#ffffff,#e6f0ff);
-    color:#0b57d0;
-    border: 3px solid #0b57d0;
-    transform: translateY(-2px);
-    box-shadow: 0 8px 18px rgba(11,87,208,0.12);
-}
-
-/* small button under seat */
-.seat-action {
-    margin-top:8px;
-}
-
-/* Legend */
-.legend {
-    display:flex;
-    gap:12px;
-    align-items:center;
-    margin-top:12px;
-}
-.legend .item {
-    display:flex;
-    gap:8px;
-    align-items:center;
-}
-
-/* Desktop & larger tablets: keep decks side-by-side (no horizontal scroll) */
-@media (min-width: 701px) {
-    .deck-container { overflow: visible; padding-bottom: 0; }
-    .deck { min-width: 0; }
-}
-
-/* Mobile: place decks horizontally and allow smooth horizontal scroll */
-@media (max-width: 700px) {
-    .deck-container {
-        display: flex;
-        gap: 12px;
-        overflow-x: auto;
-        -webkit-overflow-scrolling: touch;
-        scroll-snap-type: x mandatory;
-        padding: 8px 6px;
-        margin-bottom: 8px;
-    }
-    .deck {
-        flex: 0 0 86%; /* show one deck at a time mostly, allow peeking */
-        min-width: 280px;
-        max-width: 92%;
-        scroll-snap-align: start;
-    }
-    /* reduce vertical padding inside decks to avoid long vertical scroll */
-    .deck { padding: 10px; }
-    .seat-wrap { width:72px; }
-    .seat-rect { width:60px; height:86px; font-size:15px; }
-}
-</style>
-""", unsafe_allow_html=True)
+# --- one stylesheet for the whole app (static/app.css), cached per process ---
+# header background: a cached, content-versioned static URL (no per-rerun file read)
+header_bg = asset_url("wave_web.jpg")
+header_bg_css = (
+    '.header{background-image:linear-gradient(rgba(0,0,0,0.35),rgba(0,0,0,0.35)),'
+    f'url("{header_bg}")}}' if header_bg else ''
+)
+st.markdown(stylesheet_html("app.css", extra_css=header_bg_css), unsafe_allow_html=True)
 
 
 # Initialize session state
@@ -201,27 +51,13 @@ if 'discount_percentage' not in st.session_state:
     st.session_state.discount_percentage = 0
 if 'final_amount' not in st.session_state:
     st.session_state.final_amount = 0.0
+# deliver any mail left in the spool by an earlier run (no-op once running)
+if mail_configured():
+    mail_queue.start()
 
-# Ensure booked seats persist for session (random demo)
-if 'booked_seats' not in st.session_state:
-    random.seed(42)
-    # pick about 20% seats as sold -> 30 seats total -> ~6 sold
-    st.session_state.booked_seats = set(random.sample(range(1, 31), k=6))
-
-import streamlit as st
-import streamlit.components.v1 as components
-import re, json
-# Diwali discounts (unchanged)
-DIWALI_DISCOUNTS = [
-    {"code": "DIWALI25", "discount": 25, "description": "Diwali Special - 25% OFF"},
-    {"code": "FESTIVE20", "discount": 20, "description": "Festival Bonanza - 20% OFF"},
-    {"code": "LIGHTS15", "discount": 15, "description": "Festival of Lights - 15% OFF"},
-]
-
-
-def _id(s: str) -> str:
-    # sanitize for use in element ids
-    return re.sub(r'[^a-zA-Z0-9_-]', '_', s)
+if 'hold_owner' not in st.session_state:
+    # identifies this browser session's seat holds
+    st.session_state.hold_owner = uuid.uuid4().hex
 
 # Cities
 CITIES = ["Mumbai", "Delhi", "Bangalore", "Chennai", "Kolkata",
@@ -233,58 +69,90 @@ BUS_TYPES = {
     "Seater": {"seats": 50, "price": 600}
 }
 
-# --- add helper to cancel a user's booking (uses utils.auth load/save if available) ---
+# --- add helper to cancel a user's booking (journaled through utils.auth) ---
 def cancel_user_booking(username: str, booking_id: str):
     """
     Remove a booking (cancel) from the stored users file.
     Returns (success: bool, message: str)
     """
     try:
-        auth = __import__('utils.auth', fromlist=['load_users', 'save_users'])
-        load_users = getattr(auth, 'load_users', None)
-        save_users = getattr(auth, 'save_users', None)
-        if not load_users or not save_users:
-            return False, "Cancellation not supported (missing functions)."
-        users = load_users()
+        removed = remove_booking(username, booking_id)
     except Exception:
-        return False, "Unable to access user database."
+        return False, "Failed to save cancellation."
 
-    if username in users:
-        bookings = users[username].get('bookings', [])
-        for b in list(bookings):  # iterate over copy so we can remove
-            if b.get('booking_id') == booking_id:
-                try:
-                    # remove the booking entirely
-                    users[username]['bookings'].remove(b)
-                    save_users(users)
-                except Exception:
-                    return False, "Failed to save cancellation."
-                # clear any session copy if present
-                if st.session_state.get('booking_details', {}).get('booking_id') == booking_id:
-                    st.session_state.booking_details = {}
-                return True, "Booking cancelled and removed from your bookings."
+    if removed:
+        # clear any session copy if present
+        if st.session_state.get('booking_details', {}).get('booking_id') == booking_id:
+            st.session_state.booking_details = {}
+        return True, "Booking cancelled and removed from your bookings."
     return False, "Booking not found!"
 
-# --- helper: load latest bookings for a user (safe fallback) ---
-def get_latest_user_bookings(username):
+# --- helper: load one page of a user's bookings (safe fallback) ---
+def get_latest_user_bookings(username, offset=0, limit=3, sort='booked'):
     """
-    Try to load users via utils.auth.load_users() and return the user's bookings list.
-    Fallback to get_user_bookings(username) if load_users isn't available.
+    Return (bookings, total) for one page of the user's bookings, newest
+    first. The store picks up cancellations and other sessions' writes on
+    access, and only the requested page is copied out of it.
     """
     try:
-        auth = __import__('utils.auth', fromlist=['load_users'])
-        load_users = getattr(auth, 'load_users', None)
-        if callable(load_users):
-            users = load_users()
-            return users.get(username, {}).get('bookings', [])
+        return get_booking_history(username, offset=offset, limit=limit, sort=sort)
     except Exception:
-        pass
+        return [], 0
+
+
+def show_booking(booking, key_prefix):
+    """One booking as an expander, with a cancel button"""
+    with st.expander(f"Booking: {booking.get('from_city','N/A')} → {booking.get('to_city','N/A')} ({booking.get('date','N/A')})"):
+        st.write(f"**Booking ID:** {booking.get('booking_id','N/A')}")
+        st.write(f"**Passengers:** {booking.get('passengers','N/A')}")
+        st.write(f"**Seats:** {', '.join(map(str, booking.get('seats',[])))}")
+        st.write(f"**Total Amount:** ₹{booking.get('total_amount','N/A')}")
+        st.write(f"**Bus Number:** {booking.get('bus_number','N/A')}")
+        st.write(f"**Driver Contact:** {booking.get('driver_number','N/A')}")
+        st.write(f"**Departure Time:** {booking.get('departure_time', 'N/A')}")
+        # normalize status display
+        status_display = "Cancelled" if 'cancel' in str(booking.get('status', '') or '').lower() else "Confirmed"
+        st.write(f"**Status:** {status_display}")
+        if status_display == "Cancelled":
+            return
+        # unique key per booking entry
+        btn_key = f"cancel_{key_prefix}_{booking.get('booking_id','')}"
+        if st.button(f"Cancel Booking {booking.get('booking_id','')}", key=btn_key):
+            success, msg = cancel_user_booking(st.session_state.username, booking.get('booking_id',''))
+            if success:
+                st.success(msg)
+                # refresh the whole dashboard to reflect deletion
+                st.rerun()
+            else:
+                st.error(msg)
 
-    # fallback if above fails
-    try:
-        return get_user_bookings(username)
-    except Exception:
-        return []
+# --- helper: apply a confirmed seat-map selection (runs as a widget callback) ---
+def commit_seat_selection(key, trip_id, trip, passengers):
+    """
+    Hold the newly picked seats (all or none) and release the dropped ones.
+    Called once per "Confirm seats" press, before the script reruns.
+    """
+    picked = st.session_state.get(key) or {}
+    current = set(st.session_state.selected_seats)
+    wanted = {int(s) for s in picked.get('seats', [])}
+    if len(wanted) > passengers:
+        st.session_state.seat_map_notice = f"You can only select {passengers} seats!"
+        return
+    if wanted == current:
+        return
+    taken = seat_holds.hold(trip_id, sorted(wanted - current), st.session_state.hold_owner,
+                            unavailable=get_sold_seats(*trip))
+    if taken:
+        st.session_state.seat_map_notice = (
+            f"Seat(s) {', '.join(map(str, taken))} were just taken by another traveller.")
+        return
+    seat_holds.release(trip_id, current - wanted, st.session_state.hold_owner)
+    st.session_state.selected_seats = sorted(wanted)
+    st.session_state.seats_changed = True
+    # reset discount when seats changed
+    st.session_state.discount_applied = False
+    st.session_state.discount_percentage = 0
+    st.session_state.final_amount = 0.0
 
 # ---------- Pages (login, dashboard, booking, confirmation) ----------
 def login_page():
@@ -333,108 +201,6 @@ def login_page():
                     st.error("Passwords don't match!")
             else:
                 st.warning("Please fill in all fields!")
-image_path="images/wave_web.jpg"
-def add_bg_from_local(image_path):
-    try:
-        with open(image_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode()
-            return encoded
-    except Exception:
-        # If image can't be read, return empty string so CSS falls back gracefully
-        return ""
-
-# get encoded string once (prevents NameError)
-encoded = add_bg_from_local(image_path)
-
-# apply CSS; if encoded is empty use a safe fallback background
-if encoded:
-    st.markdown(
-        f"""
-        <style>
-        .header {{
-            text-align: center;
-            background-image: 
-                linear-gradient(rgba(0, 0, 0, 0.35), rgba(0, 0, 0, 0.35)),
-                url("data:image/png;base64,{encoded}");
-            background-size: cover;
-            background-position: center;
-            border-radius: 20px;
-            padding: 100px 30px;
-            color: white;
-            font-family: 'Poppins', sans-serif;
-            box-shadow: 0 4px 20px rgba(0,0,0,0.2);
-        }}
-
-        .header h1 {{
-            font-size: 3rem;
-            font-weight: 700;
-            margin-bottom: 10px;
-            letter-spacing: 1px;
-        }}
-
-        .header p {{
-            font-size: 1.3rem;
-            font-weight: 400;
-            color: #f3f3f3;
-        }}
-
-        .promo {{
-            background: linear-gradient(90deg, #ff8fab, #ffc8dd);
-            color: #2b2b2b;
-            font-weight: 600;
-            border-radius: 10px;
-            text-align: center;
-            padding: 12px;
-            margin-top: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }}
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-else:
-    # fallback CSS if image missing / couldn't be read
-    st.markdown(
-        """
-        <style>
-        .header {
-            text-align: center;
-            background: linear-gradient(135deg,#667eea 0%,#764ba2 100%);
-            border-radius: 20px;
-            padding: 60px 30px;
-            color: white;
-            font-family: 'Poppins', sans-serif;
-            box-shadow: 0 4px 20px rgba(0,0,0,0.2);
-        }
-
-        .header h1 {
-            font-size: 2.2rem;
-            font-weight: 700;
-            margin-bottom: 10px;
-            letter-spacing: 1px;
-        }
-
-        .header p {
-            font-size: 1rem;
-            font-weight: 400;
-            color: #f3f3f3;
-        }
-
-        .promo {
-            background: linear-gradient(90deg, #ff8fab, #ffc8dd);
-            color: #2b2b2b;
-            font-weight: 600;
-            border-radius: 10px;
-            text-align: center;
-            padding: 12px;
-            margin-top: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-
 def dashboard():
     """Main Dashboard"""
     st.markdown(
@@ -448,33 +214,8 @@ def dashboard():
     )
 
    # Diwali discount banner
-    # Diwali discount banner with golden hour shimmer ✨
+    # Diwali discount banner with golden hour shimmer ✨ (styles in static/app.css)
     st.markdown("""
-<style>
-@keyframes glowMove {
-    0% { background-position: 0% 50%; }
-    50% { background-position: 100% 50%; }
-    100% { background-position: 0% 50%; }
-}
-.glow-banner {
-    background: linear-gradient(90deg, #ffcf6f, #ffb88c, #f9a826, #ffd27f);
-    background-size: 300% 300%;
-    animation: glowMove 6s ease-in-out infinite;
-    padding: 14px 18px;
-    border-radius: 12px;
-    color: #3b2f2f;
-    font-family: 'Poppins', sans-serif;
-    font-weight: 600;
-    letter-spacing: 0.3px;
-    text-align: center;
-    box-shadow: 0 4px 16px rgba(0,0,0,0.1);
-    margin-bottom: 16px;
-}
-.glow-banner span {
-    font-weight: 500;
-}
-</style>
-
 <div class="glow-banner">
     <strong>✨ DIWALI GOLDEN HOUR DEALS ✨</strong> 
     <span>Score up to <b>25% OFF</b> on your next trip — glow & go!</span>
@@ -499,14 +240,14 @@ def dashboard():
             st.rerun()
 
     with col2:
-        bookings = get_user_bookings(st.session_state.username)
+        booking_count = get_user_booking_count(st.session_state.username)
         st.markdown(f"""
         <div style="background:white;
                     padding:18px;
                     border-radius:12px;
                     box-shadow:0 6px 18px rgba(0,0,0,0.06);">
             <h3>🎫 My Bookings</h3>
-            <p>Total Bookings: {len(bookings)}</p>
+            <p>Total Bookings: {booking_count}</p>
         </div>
         """, unsafe_allow_html=True)
 
@@ -521,39 +262,21 @@ def dashboard():
         </div>
         """, unsafe_allow_html=True)
 
-    # replace previous call with fresh loader so canceled bookings reflect immediately
-    bookings = get_latest_user_bookings(st.session_state.username)
+    # only the three newest bookings are fetched, however many the user has
+    bookings, total = get_latest_user_bookings(st.session_state.username)
 
     # Display user bookings
     if bookings:
         st.subheader("Your Recent Bookings")
-        for i, booking in enumerate(bookings[-3:]):
+        for booking in bookings:
             # skip bookings that are cancelled (in case some entries still have a 'cancel' status)
             raw_status = str(booking.get('status', '') or '').strip().lower()
             if 'cancel' in raw_status:
                 continue
+            show_booking(booking, 'recent')
 
-            with st.expander(f"Booking: {booking.get('from_city','N/A')} → {booking.get('to_city','N/A')} ({booking.get('date','N/A')})"):
-                st.write(f"**Booking ID:** {booking.get('booking_id','N/A')}")
-                st.write(f"**Passengers:** {booking.get('passengers','N/A')}")
-                st.write(f"**Seats:** {', '.join(map(str, booking.get('seats',[])))}")
-                st.write(f"**Total Amount:** ₹{booking.get('total_amount','N/A')}")
-                st.write(f"**Bus Number:** {booking.get('bus_number','N/A')}")
-                st.write(f"**Driver Contact:** {booking.get('driver_number','N/A')}")
-                st.write(f"**Departure Time:** {booking.get('departure_time', 'N/A')}")
-                # normalize status display
-                status_display = "Confirmed"
-                st.write(f"**Status:** {status_display}")
-                # unique key per booking entry
-                btn_key = f"cancel_{booking.get('booking_id','')}_{i}"
-                if st.button(f"Cancel Booking {booking.get('booking_id','')}", key=btn_key):
-                    success, msg = cancel_user_booking(st.session_state.username, booking.get('booking_id',''))
-                    if success:
-                        st.success(msg)
-                        # refresh to reflect deletion
-                        st.rerun()
-                    else:
-                        st.error(msg)
+    if total > len(bookings):
+        booking_history_section(st.session_state.username)
 
     if st.button("Logout"):
         st.session_state.logged_in = False
@@ -562,12 +285,52 @@ def dashboard():
         st.rerun()
 
 
+def set_history_page(page):
+    st.session_state.history_page = page
+
+
+@st.fragment
+def booking_history_section(username):
+    """
+    All of the user's bookings, a page at a time. A fragment, so paging
+    and re-sorting rerun only this section.
+    """
+    st.subheader("Booking History")
+    sort_label = st.radio("Sort by", ["Travel date", "Booking time"], horizontal=True,
+                          key="history_sort", on_change=set_history_page, args=(0,))
+    sort = 'date' if sort_label == "Travel date" else 'booked'
+
+    page = st.session_state.get('history_page', 0)
+    bookings, total = get_latest_user_bookings(username, offset=page * HISTORY_PAGE_SIZE,
+                                               limit=HISTORY_PAGE_SIZE, sort=sort)
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    if page >= pages:
+        # bookings were cancelled since this page was picked
+        page = st.session_state.history_page = pages - 1
+        bookings, total = get_latest_user_bookings(username, offset=page * HISTORY_PAGE_SIZE,
+                                                   limit=HISTORY_PAGE_SIZE, sort=sort)
+
+    for booking in bookings:
+        show_booking(booking, 'history')
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("← Previous", key="history_prev", disabled=page == 0,
+                  on_click=set_history_page, args=(page - 1,))
+    with col2:
+        st.caption(f"Page {page + 1} of {pages} · {total} bookings")
+    with col3:
+        st.button("Next →", key="history_next", disabled=page >= pages - 1,
+                  on_click=set_history_page, args=(page + 1,))
+
+
 def booking_page():
     """Booking Page with redesigned sleeper two-deck UI (30 seats: 15 lower + 15 upper)"""
     st.markdown('<div class="header"><h1> Book Your Bus Ticket</h1></div>', unsafe_allow_html=True)
 
     # Back button
     if st.button("← Back to Dashboard"):
+        seat_holds.release_owner(st.session_state.hold_owner)
         st.session_state.page = 'dashboard'
         st.session_state.selected_seats = []
         st.session_state.booking_details = {}
@@ -604,6 +367,27 @@ def booking_page():
     st.subheader("Select Bus Type")
     bus_type = st.radio("Bus Type", list(BUS_TYPES.keys()), horizontal=True, key="bus_type")
 
+    # Discount codes usable on this route today (rules live in discounts.json);
+    # all of them with copy buttons in one frame (utils/coupon_panel.py)
+    coupon_panel(active_discounts(from_city, to_city))
+
+    # The seat map and the pricing panel are fragments: their widgets only
+    # rerun their own section. Journey changes above affect both, so those
+    # still rerun the whole page.
+    trip = (from_city, to_city, str(travel_date), departure_time, bus_type)
+    seat_map_section(trip, passengers)
+    pricing_section(trip, passengers)
+
+
+@st.fragment
+def seat_map_section(trip, passengers):
+    """Seat preferences, seat map and seat stats (reruns on its own)"""
+    # a newly confirmed selection also changes the pricing panel
+    if st.session_state.pop('seats_changed', False):
+        st.rerun()
+
+    bus_type = trip[-1]
+
     # Seat preferences
     st.subheader("Seat Preferences")
     colA, colB = st.columns(2)
@@ -612,195 +396,50 @@ def booking_page():
     with colB:
         show_women_seats = st.checkbox("Show Women Seats", value=True, key="show_women")
 
-    # Diwali discounts display
-    DIWALI_DISCOUNTS = [
-        {"code": "DIWALI25", "discount": 25, "description": "Diwali Special - 25% OFF"},
-        {"code": "FESTIVE20", "discount": 20, "description": "Festival Bonanza - 20% OFF"},
-        {"code": "LIGHTS15", "discount": 15, "description": "Festival of Lights - 15% OFF"},
-    ]
-    
-    # --- Render coupon codes with a copy button beside each code ---
-    def render_discount_codes(discounts):
-        for d in discounts:
-            code = d["code"]
-            desc = d["description"]
-            btn_id = f"btn_{_id(code)}"
-            # small HTML row: code + description on left, Copy button on right
-            html = f'''
-            <div style="display:flex;align-items:center;justify-content:space-between;padding:8px;border-radius:8px;background:#f8fbff;margin-bottom:6px;font-family:inherit">
-              <div style="flex:1;display:flex;align-items:center;gap:12px;">
-                <strong style="color:#0047ab;font-size:16px;">{code}</strong>
-                <span style="color:#333;">{desc}</span>
-              </div>
-              <button id="{btn_id}" style="padding:6px 10px;border-radius:6px;border:none;background:#0047ab;color:#fff;cursor:pointer">
-                Copy
-              </button>
-            </div>
-            <script>
-            (function(){{
-              const btn = document.getElementById("{btn_id}");
-              if(!btn) return;
-              btn.addEventListener('click', function() {{
-                const text = "{code}";
-                if (navigator && navigator.clipboard && navigator.clipboard.writeText) {{
-                  navigator.clipboard.writeText(text).then(function() {{
-                    const orig = btn.textContent;
-                    btn.textContent = '✓ Copied';
-                    btn.disabled = true;
-                    setTimeout(function(){{ btn.textContent = orig; btn.disabled = false; }}, 1500);
-                  }}).catch(function() {{
-                    window.prompt('Copy the code:', text);
-                  }});
-                }} else {{
-                  window.prompt('Copy the code:', text);
-                }}
-              }});
-            }})();
-            </script>
-            '''
-            components.html(html, height=72)
-
-    # call the renderer so codes show up with copy buttons beside them
-    render_discount_codes(DIWALI_DISCOUNTS)
-
     # Seat selection UI
     st.subheader(f"Select Your Seats (Sleeper layout)")
 
     # We'll use 30 seats total (regardless of BUS_TYPES 'seats' count),
     # but per-seat price comes from chosen bus_type
     TOTAL_SEATS = 30
-    LOWER_SEATS = list(range(1, 16))   # 1..15
-    UPPER_SEATS = list(range(16, 31))  # 16..30
     price_per_seat = BUS_TYPES[bus_type]["price"]
 
-    # Determine female seats deterministically: every 3rd seat (like before)
-    def is_female(seat_num):
-        return seat_num % 3 == 0
-
-    # Helper to render a deck
-    def render_deck(deck_name, seats):
-        st.markdown(f'<div class="deck"><div class="deck-title"><h3>{deck_name}</h3><div style="opacity:0.7;font-size:13px;">Driver at front</div></div>', unsafe_allow_html=True)
-
-        # 5 rows x 3 seats = 15 seats per deck (sleeper)
-        seats_per_row = 3
-        rows = 5
-
-        for r in range(rows):
-            # Create a row of seat columns
-            cols = st.columns(seats_per_row)
-            with st.container():
-                # Using markup + Streamlit button per seat
-                for c in range(seats_per_row):
-                    seat_index = r * seats_per_row + c
-                    if seat_index >= len(seats):
-                        continue
-                    seat_num = seats[seat_index]
-
-                    # booked? selected? female?
-                    is_booked = (seat_num in st.session_state.booked_seats)
-                    selected = (seat_num in st.session_state.selected_seats)
-                    female = is_female(seat_num)
-
-                    # inside each column, display price bubble if selected, seat box, and a toggle button
-                    with cols[c]:
-                        # price bubble display when selected
-                        if selected:
-                            st.markdown(f'<div class="price-bubble">₹{price_per_seat}</div>', unsafe_allow_html=True)
-                        else:
-                            # keep a small spacer for alignment
-                            st.write("")
-
-                        # seat box styling
-                        if is_booked:
-                            st.markdown(
-                                f'''
-                                <div class="seat-wrap">
-                                    <div class="seat-rect seat-male" style="opacity:0.45;">
-                                        <div class="sold-overlay">Sold</div>
-                                        <div style="position:relative;z-index:2;">{seat_num}</div>
-                                    </div>
-                                </div>
-                                ''',
-                                unsafe_allow_html=True)
-                        else:
-                            if selected:
-                                # render selected style
-                                st.markdown(
-                                    f'''
-                                    <div class="seat-wrap">
-                                        <div class="seat-rect seat-selected">{seat_num}</div>
-                                    </div>
-                                    ''',
-                                    unsafe_allow_html=True
-                                )
-                            else:
-                                # render male/female unselected
-                                if female and show_women_seats:
-                                    st.markdown(
-                                        f'''
-                                        <div class="seat-wrap">
-                                            <div class="seat-rect seat-female">{seat_num}</div>
-                                        </div>
-                                        ''',
-                                        unsafe_allow_html=True
-                                    )
-                                elif (not female) and show_men_seats:
-                                    st.markdown(
-                                        f'''
-                                        <div class="seat-wrap">
-                                            <div class="seat-rect seat-male">{seat_num}</div>
-                                        </div>
-                                        ''',
-                                        unsafe_allow_html=True
-                                    )
-                                else:
-                                    # If preference filters hide this seat, show nothing (or small spacer)
-                                    st.write("")
-
-                        # Seat action button (select/deselect)
-                        if is_booked:
-                            # no button for booked seat
-                            st.button(" ", key=f"noop_{seat_num}", disabled=True, args=None)
-                        else:
-                            if selected:
-                                if st.button(f"Deselect {seat_num}", key=f"deselect_{seat_num}"):
-                                    st.session_state.selected_seats.remove(seat_num)
-                                    # reset discount when seats changed
-                                    st.session_state.discount_applied = False
-                                    st.session_state.discount_percentage = 0
-                                    st.session_state.final_amount = 0.0
-                                    st.rerun()
-                            else:
-                                if st.button(f"Select {seat_num}", key=f"select_{seat_num}"):
-                                    if len(st.session_state.selected_seats) < passengers:
-                                        st.session_state.selected_seats.append(seat_num)
-                                        st.rerun()
-                                    else:
-                                        st.warning(f"You can only select {passengers} seats!")
-
-        st.markdown("</div>", unsafe_allow_html=True)  # close deck div
-
-    # Two columns for Lower and Upper deck
-    deck_col1, spacer_col, deck_col2 = st.columns([1, 0.05, 1])
-    st.markdown("""
-<div class="deck-container">
-    <div class="deck">
-""", unsafe_allow_html=True)
-    with deck_col1:
-        render_deck("Lower deck", LOWER_SEATS)
-
-    st.markdown("""
-    </div>
-    <div class="deck">
-""", unsafe_allow_html=True)
-
-    with deck_col2:
-        render_deck("Upper deck", UPPER_SEATS)
-
-    st.markdown("""
-    </div>
-</div>
-""", unsafe_allow_html=True)
+    # Sold seats come from the shared inventory for this exact trip
+    trip_id = trip_key(*trip)
+    hold_owner = st.session_state.hold_owner
+    booked_seats = get_sold_seats(*trip)
+
+    # switching trips gives up the holds on the previous one
+    if st.session_state.get('hold_trip') != trip_id:
+        seat_holds.release_owner(hold_owner)
+        st.session_state.hold_trip = trip_id
+
+    # renew our holds; drop any selected seat lost to another traveller
+    lost = seat_holds.hold(trip_id, st.session_state.selected_seats, hold_owner,
+                           unavailable=booked_seats)
+    if lost:
+        st.session_state.selected_seats = [s for s in st.session_state.selected_seats
+                                           if s not in lost]
+        seat_holds.hold(trip_id, st.session_state.selected_seats, hold_owner,
+                        unavailable=booked_seats)
+        st.warning(f"Seat(s) {', '.join(map(str, lost))} are no longer available.")
+    held_seats = seat_holds.held_by_others(trip_id, hold_owner)
+
+    notice = st.session_state.pop('seat_map_notice', None)
+    if notice:
+        st.warning(notice)
+
+    # Whole two-deck layout in one component; seats are toggled in the
+    # browser and the confirmed batch is applied by commit_seat_selection
+    # before the (single) rerun, so the deck never re-renders per click
+    seat_map_key = f"seat_map_{trip_id}"
+    seat_map(sold=booked_seats, held=held_seats,
+             selected=st.session_state.selected_seats,
+             max_select=passengers, price=price_per_seat,
+             show_men=show_men_seats, show_women=show_women_seats,
+             key=seat_map_key,
+             on_change=functools.partial(commit_seat_selection, seat_map_key, trip_id,
+                                         trip, passengers))
 
 
     # Legend and seat stats
@@ -817,7 +456,14 @@ def booking_page():
             <strong>Total seats:</strong> 30 &nbsp;&nbsp; | &nbsp;&nbsp; <strong>Available:</strong> {available_count}
         </div>
     </div>
-    """.replace("{available_count}", str(TOTAL_SEATS - len(st.session_state.booked_seats))), unsafe_allow_html=True)
+    """.replace("{available_count}", str(TOTAL_SEATS - len(booked_seats | held_seats))), unsafe_allow_html=True)
+
+
+@st.fragment
+def pricing_section(trip, passengers):
+    """Discount code, pricing and confirmation (reruns on its own)"""
+    from_city, to_city, travel_date, departure_time, bus_type = trip
+    price_per_seat = BUS_TYPES[bus_type]["price"]
 
     # Show selected seats and pricing (same logic as your original)
     if st.session_state.selected_seats:
@@ -830,24 +476,22 @@ def booking_page():
         discount_code = st.text_input("Enter Discount Code", key="discount_code")
 
         if st.button("Apply Discount"):
-            discount_found = False
-            for discount in DIWALI_DISCOUNTS:
-                if discount_code.upper() == discount['code']:
-                    discount_found = True
-                    discount_amount = (total_amount * discount['discount']) / 100
-                    final_amount = total_amount - discount_amount
-
-                    st.session_state.discount_applied = True
-                    st.session_state.discount_percentage = discount['discount']
-                    st.session_state.final_amount = final_amount
-                    st.session_state.show_party = True
-
-                    st.markdown('<div style="text-align:center;font-size:28px;margin-top:6px;">🎉🎊</div>', unsafe_allow_html=True)
-                    st.balloons()
-                    st.success(f"🎉 {discount['discount']}% discount applied! You saved ₹{discount_amount:.2f}!")
-                    break
-            if not discount_found:
-                st.error("Invalid discount code!")
+            discount, error = check_discount(discount_code, from_city, to_city)
+            if discount:
+                discount_amount = (total_amount * discount['discount']) / 100
+                final_amount = total_amount - discount_amount
+
+                st.session_state.discount_applied = True
+                st.session_state.discount_code_applied = discount['code']
+                st.session_state.discount_percentage = discount['discount']
+                st.session_state.final_amount = final_amount
+                st.session_state.show_party = True
+
+                st.markdown('<div style="text-align:center;font-size:28px;margin-top:6px;">🎉🎊</div>', unsafe_allow_html=True)
+                st.balloons()
+                st.success(f"🎉 {discount['discount']}% discount applied! You saved ₹{discount_amount:.2f}!")
+            else:
+                st.error(error)
 
         # Pricing details
         st.markdown("---")
@@ -886,23 +530,36 @@ def booking_page():
         colc1, colc2 = st.columns(2)
         with colc1:
             if st.button("✅ Confirm Booking", key="confirm_booking"):
-                booking_id = f"BK{random.randint(100000, 999999)}"
-                bus_number = f"BUS-{random.randint(1000, 9999)}"
-                driver_number = f"+91-{random.randint(70000, 99999)}-{random.randint(10000, 99999)}"
+                booking_id = new_booking_id()
+                bus_number = trip_bus_number(*trip)
+                driver_number = trip_driver_number(*trip)
 
                 final_amt = st.session_state.final_amount if st.session_state.discount_applied else total_amount
+                applied_code = st.session_state.get('discount_code_applied') if st.session_state.discount_applied else None
+
+                # count the code against its usage cap before booking;
+                # the use is given back below unless the booking is saved
+                if applied_code:
+                    redeemed, message = redeem_discount(applied_code, from_city, to_city)
+                    if not redeemed:
+                        st.session_state.discount_applied = False
+                        st.session_state.discount_percentage = 0
+                        st.session_state.final_amount = 0.0
+                        st.error(message)
+                        st.stop()
 
                 booking_details = {
                     'booking_id': booking_id,
                     'from_city': from_city,
                     'to_city': to_city,
-                    'date': str(travel_date),
+                    'date': travel_date,
                     'departure_time': departure_time,
                     'passengers': passengers,
                     'seats': sorted(st.session_state.selected_seats),
                     'bus_type': bus_type,
                     'total_amount': final_amt,
                     'discount': st.session_state.discount_percentage if st.session_state.discount_applied else 0,
+                    'discount_code': applied_code,
                     'bus_number': bus_number,
                     'driver_number': driver_number,
                     'payment_mode': 'Cash on Boarding',
@@ -910,11 +567,22 @@ def booking_page():
                     'status': 'confirmed'
                 }
 
-                # persist booking and send confirmation email
-                add_booking(st.session_state.username, booking_details)
+                # reserve the seats and persist the booking in one step
+                booked = False
+                try:
+                    booked, message = book_seats(st.session_state.username, booking_details)
+                finally:
+                    if applied_code and not booked:
+                        release_discount(applied_code)
+                if not booked:
+                    st.error(message)
+                    st.stop()
+                # the seats are sold now, so our holds are no longer needed
+                seat_holds.release_owner(st.session_state.hold_owner)
+
+                # send confirmation email
                 try:
-                    users = __import__('utils.auth', fromlist=['load_users']).load_users()
-                    user_email = users.get(st.session_state.username, {}).get('email', '')
+                    user_email = get_user_email(st.session_state.username)
                     email_result = send_confirmation_email(user_email, booking_details)
                 except Exception:
                     email_result = {'success': False, 'error': 'Email send failed (demo mode).'}
@@ -926,6 +594,7 @@ def booking_page():
 
         with colc2:
             if st.button("🔄 Modify Booking", key="modify_booking"):
+                seat_holds.release_owner(st.session_state.hold_owner)
                 st.session_state.selected_seats = []
                 st.session_state.discount_applied = False
                 st.session_state.show_party = False
@@ -997,8 +666,8 @@ def confirmation_page():
 
     st.markdown("---")
     st.subheader("📧 Email Confirmation")
-    if st.session_state.email_result.get('success', False):
-        st.success("✅ Confirmation email has been sent to your registered email address!")
+    if st.session_state.email_result.get('queued', False):
+        st.success("✅ Confirmation email is on its way to your registered email address!")
     else:
         st.warning("⚠️ Email sending is in demo mode. In production, you'll receive a confirmation email.")
 
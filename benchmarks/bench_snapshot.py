@@ -0,0 +1,123 @@
+"""
+Snapshot write time and size for each serialization format.
+
+Builds a synthetic store (100k users by default, two bookings each) and
+times writing it as users.json the old way (json.dump with indent=4)
+against the formats utils.auth.encode_snapshot supports, plus the time
+to stream it back in. orjson and msgpack rows appear only when those
+packages are installed.
+
+    python -m benchmarks.bench_snapshot [--users 100000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from utils import auth
+from utils.ids import trip_bus_number, trip_driver_number
+
+CITIES = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Ahmedabad']
+BUS_TYPES = ['AC Sleeper', 'Non-AC Sleeper', 'AC Seater', 'Non-AC Seater']
+TIMES = ['06:00', '09:30', '14:00', '18:30', '22:00']
+
+
+def synthetic_users(count, bookings_per_user=2, seed=1):
+    rng = random.Random(seed)
+    users = {}
+    for i in range(count):
+        bookings = []
+        for j in range(bookings_per_user):
+            trip = (*rng.sample(CITIES, 2), f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                    rng.choice(TIMES), rng.choice(BUS_TYPES))
+            passengers = rng.randint(1, 4)
+            bookings.append({
+                'booking_id': f'BK{i:07d}{j}',
+                'from_city': trip[0],
+                'to_city': trip[1],
+                'date': trip[2],
+                'departure_time': trip[3],
+                'bus_type': trip[4],
+                'passengers': passengers,
+                'seats': sorted(rng.sample(range(1, 31), passengers)),
+                'total_amount': passengers * 850,
+                'discount': rng.choice([0, 0, 0, 10, 15]),
+                'discount_code': '',
+                'bus_number': trip_bus_number(*trip),
+                'driver_number': trip_driver_number(*trip),
+                'payment_mode': 'Cash on Boarding',
+                'booking_time': f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}',
+                'status': 'confirmed',
+            })
+        users[f'user{i}'] = {
+            'email': f'user{i}@example.com',
+            'password': '$2b$12$' + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=53)),
+            'phone': f'9{rng.randint(100000000, 999999999)}',
+            'bookings': bookings,
+        }
+    return users
+
+
+def _old_write(users, path):
+    with open(path, 'w') as f:
+        json.dump(users, f, indent=4)
+
+
+def _new_write(fmt, stdlib=False):
+    def write(users, path):
+        saved = auth.orjson
+        if stdlib:
+            auth.orjson = None
+        try:
+            with open(path, 'wb') as f:
+                f.write(auth.encode_snapshot(users, fmt))
+        finally:
+            auth.orjson = saved
+    return write
+
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"Building {args.users} synthetic users...")
+    users = synthetic_users(args.users)
+
+    cases = [('json.dump indent=4 (before)', _old_write),
+             ('compact json, stdlib', _new_write('json', stdlib=True))]
+    if auth.orjson is not None:
+        cases.append(('compact json, orjson', _new_write('json')))
+    if auth.msgpack is not None:
+        cases.append(('msgpack', _new_write('msgpack')))
+
+    print(f"{'format':<30}{'write':>10}{'size':>12}{'read':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.json')
+        saved_file = auth.USERS_FILE
+        auth.USERS_FILE = path
+        try:
+            for name, write in cases:
+                write_time = _best(lambda: write(users, path), args.repeat)
+                size = os.path.getsize(path)
+                read_time = _best(auth._read_snapshot, args.repeat)
+                print(f"{name:<30}{write_time:>9.2f}s{size / 1e6:>10.1f}MB{read_time:>9.2f}s")
+        finally:
+            auth.USERS_FILE = saved_file
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Process-level cache for static assets.
+
+Streamlit re-runs app.py on every interaction, so anything derived from
+a file (encoded images, stylesheets) is computed once per process here
+and only rebuilt when the file's mtime/size changes.
+"""
+import base64
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+import streamlit as st
+
+# Served by Streamlit at app/static/ when server.enableStaticServing is on
+STATIC_DIR = 'static'
+STATIC_URL = 'app/static'
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def cached_file(path, kind, build):
+    """
+    Return build(bytes) for a file, cached per (path, kind) until the
+    file changes. Returns None if the file can't be read.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (path, kind)
+    entry = _cache.get(key)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+    with open(path, 'rb') as f:
+        value = build(f.read())
+    with _cache_lock:
+        _cache[key] = (signature, value)
+    return value
+
+
+def _content_hash(data):
+    return hashlib.sha1(data).hexdigest()[:10]
+
+
+def _data_uri(path, data):
+    mime = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+def static_serving_enabled() -> bool:
+    try:
+        return bool(st.get_option('server.enableStaticServing'))
+    except Exception:
+        return False
+
+
+def asset_url(name: str) -> str:
+    """
+    URL for a file in STATIC_DIR, versioned by content hash so browsers
+    can cache it forever. Falls back to an inline data URI when static
+    serving is off, and to "" when the file is missing.
+    """
+    path = os.path.join(STATIC_DIR, name)
+    if static_serving_enabled():
+        digest = cached_file(path, 'hash', _content_hash)
+        return f"{STATIC_URL}/{name}?v={digest}" if digest else ""
+    return cached_file(path, 'data-uri', lambda data: _data_uri(path, data)) or ""
+
+
+def minify_css(data) -> str:
+    """Strip comments and redundant whitespace from a stylesheet"""
+    css = data.decode('utf-8') if isinstance(data, bytes) else data
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    # keep the space before ':' (".a :hover" differs from ".a:hover")
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def stylesheet_html(name: str, extra_css: str = '') -> str:
+    """
+    A single <style> tag with a stylesheet from STATIC_DIR, minified once
+    per process. `extra_css` is for the few rules that depend on runtime
+    values.
+
+    The CSS is inlined rather than linked from STATIC_URL: Streamlit's
+    static file server sends files that aren't images as text/plain with
+    nosniff, so browsers would refuse a linked stylesheet.
+    """
+    path = os.path.join(STATIC_DIR, name)
+    css = cached_file(path, 'minified', minify_css) or ''
+    return f"<style>{css}{extra_css}</style>"
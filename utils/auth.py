@@ -1,65 +1,807 @@
 import streamlit as st
+import hashlib
 import json
 import os
-import bcrypt
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+from utils import hashing
+from utils.fileio import atomic_open, file_lock
+from utils.discounts import release_discount
+from utils.hashing import ServerBusy
+from utils.jsonstream import iter_items
+from utils.models import Booking, User
+from utils.seats import SeatInventory, booking_trip_key, holds_seats, mask_to_seats, trip_key
 
-# File to store user data
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# File to store user data (snapshot) and the append-only journal of changes
 USERS_FILE = 'users.json'
+JOURNAL_FILE = 'users.journal'
 
+# How the snapshot is encoded: "json" (compact; written with orjson when
+# it is installed), "msgpack" (needs the msgpack package) or "pretty"
+# (indented JSON). Readers detect the format, so it can be changed at any
+# time; use utils.export_users for a human-readable copy.
+SNAPSHOT_FORMAT = os.environ.get('ZTRAVELS_SNAPSHOT_FORMAT', 'json')
 
-def load_users():
-    """Load users from JSON file safely"""
-    if os.path.exists(USERS_FILE):
+# Fold the journal back into the snapshot after this many records
+COMPACT_THRESHOLD = 1000
+
+_compact_lock = threading.Lock()
+_journal_records = None
+
+# Group commit: journal appends are written under the lock but fsync'd
+# after it is released, and one fsync covers every append before it.
+# The watermark belongs to one journal file: compaction and save_users()
+# replace the file, and its new, shorter contents need syncing afresh.
+_sync_lock = threading.Lock()
+_synced_journal = None
+_synced_offset = 0
+# Which journal file this process last appended to, and where it ended
+_journal_seen = (None, 0)
+_journal_generation = 0
+
+
+class StorageError(Exception):
+    """Raised when the users data on disk cannot be read safely"""
+
+
+def _journal_lock():
+    """Cross-process lock guarding the snapshot and journal"""
+    return file_lock(JOURNAL_FILE)
+
+
+def encode_snapshot(users, fmt=None):
+    """Serialize users for USERS_FILE, as bytes"""
+    fmt = fmt or SNAPSHOT_FORMAT
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise StorageError("ZTRAVELS_SNAPSHOT_FORMAT=msgpack needs the msgpack package")
+        return msgpack.packb(users, use_bin_type=True)
+    if fmt == 'pretty':
+        return json.dumps(users, indent=4).encode('utf-8')
+    if orjson is not None:
+        try:
+            return orjson.dumps(users)
+        except orjson.JSONEncodeError:
+            pass  # e.g. an integer beyond 64 bits; the stdlib copes
+    return json.dumps(users, separators=(',', ':')).encode('utf-8')
+
+
+def _is_msgpack(first_byte):
+    # a msgpack map starts with fixmap (0x80-0x8f), map16 or map32;
+    # a JSON object starts with '{' or whitespace
+    return bool(first_byte) and (0x80 <= first_byte[0] <= 0x8f or first_byte[0] in (0xde, 0xdf))
+
+
+def _iter_msgpack(f):
+    if msgpack is None:
+        raise StorageError(f"{USERS_FILE} is msgpack-encoded; install msgpack to read it")
+    unpacker = msgpack.Unpacker(f, raw=False)
+    try:
+        for _ in range(unpacker.read_map_header()):
+            yield unpacker.unpack(), unpacker.unpack()
+    except (ValueError, msgpack.UnpackException) as e:
+        raise ValueError(f"invalid msgpack: {e}") from e
+
+
+def _iter_snapshot():
+    """
+    Stream (username, user) pairs from the snapshot, one user at a time,
+    so reading it never needs the whole file in memory as text.
+    """
+    if not os.path.exists(USERS_FILE):
+        return
+    try:
+        with open(USERS_FILE, 'rb') as f:
+            if _is_msgpack(f.read(1)):
+                f.seek(0)
+                yield from _iter_msgpack(f)
+                return
+            f.seek(0)
+            for username, user, _, _ in iter_items(f):
+                yield username, user
+    except ValueError as e:
+        # Never fall back to {} here: the next write would wipe every account
+        raise StorageError(f"{USERS_FILE} is corrupted: {e}") from e
+
+
+def _read_snapshot():
+    """Read the compacted users snapshot"""
+    return dict(_iter_snapshot())
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form of an email address for uniqueness checks"""
+    return (email or '').strip().lower()
+
+
+def _password_digest(password):
+    # Lets a journal record name an expected old password without storing it
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+
+
+def travel_order(booking):
+    """Sort key putting bookings in order of departure"""
+    return booking.get('date') or '', booking.get('departure_time') or ''
+
+
+# Orders a booking history page can be sorted by: travel date, or the
+# order the bookings were made in (booking_time alone has no date)
+HISTORY_SORTS = ('date', 'booked')
+HISTORY_PAGE_SIZE = 10
+
+
+def _apply_record(users, record):
+    """
+    Apply one journal record to a users dict.
+    Records are idempotent so replaying one twice (e.g. after a crash
+    during compaction) leaves the data unchanged.
+    """
+    op = record.get('op')
+    username = record.get('username')
+
+    if op == 'signup':
+        users.setdefault(username, record['user'])
+        return
+
+    if op == 'passwords':
+        # Bulk upgrade: {username: [sha256 of expected current password, new hash]}
+        for name, (old_digest, new) in record['passwords'].items():
+            user = users.get(name)
+            if user is not None and _password_digest(user.get('password')) == old_digest:
+                user['password'] = new
+        return
+
+    user = users.get(username)
+    if user is None:
+        return
+
+    if op == 'booking':
+        booking = record['booking']
+        bookings = user.setdefault('bookings', [])
+        booking_id = booking.get('booking_id')
+        if not any(b.get('booking_id') == booking_id for b in bookings):
+            bookings.append(booking)
+    elif op == 'password':
+        user['password'] = record['password']
+    elif op == 'cancel':
+        # Removes one booking, the first with the ID. 'remaining' is how
+        # many the user keeps, so replaying the record is a no-op.
+        bookings = user.get('bookings', [])
+        matches = [pos for pos, b in enumerate(bookings)
+                   if b.get('booking_id') == record['booking_id']]
+        if len(matches) > record.get('remaining', 0):
+            del bookings[matches[0]]
+
+
+def _read_journal(limit=None):
+    """Journal records (up to byte offset `limit`), oldest first"""
+    if not os.path.exists(JOURNAL_FILE):
+        return []
+    with open(JOURNAL_FILE, 'rb') as f:
+        data = f.read() if limit is None else f.read(limit)
+    records = []
+    for line in data.splitlines():
         try:
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
+            records.append(json.loads(line))
         except json.JSONDecodeError:
-            # If JSON is corrupted, start fresh
-            return {}
-    return {}
+            # A torn last line from a crash mid-append; ignore it
+            continue
+    return records
+
+
+def _replay_journal(users, limit=None):
+    """Replay journal records (up to byte offset `limit`) onto users"""
+    records = _read_journal(limit)
+    for record in records:
+        _apply_record(users, record)
+    return len(records)
+
+
+def _dump_snapshot(users, f):
+    f.write(encode_snapshot(users))
+
+
+def load_users():
+    """
+    Load a fresh copy of users from the snapshot plus journaled changes.
+    Request paths should use get_user_store() instead.
+    """
+    users = _read_snapshot()
+    _replay_journal(users)
+    return users
+
+
+def stream_users():
+    """
+    Yield (username, user) for every user, snapshot plus journal, one at
+    a time. Memory use is one user plus the (compacted, short) journal.
+    """
+    by_user = {}
+    for record in _read_journal():
+        names = record['passwords'] if record.get('op') == 'passwords' else [record.get('username')]
+        for name in names:
+            by_user.setdefault(name, []).append(record)
+
+    for username, user in _iter_snapshot():
+        records = by_user.pop(username, None)
+        if records:
+            users = {username: user}
+            for record in records:
+                _apply_record(users, record)
+        yield username, user
+
+    # accounts created since the snapshot was written
+    for username, records in by_user.items():
+        users = {}
+        for record in records:
+            _apply_record(users, record)
+        if username in users:
+            yield username, users[username]
 
 
 def save_users(users):
-    """Save users to JSON file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+    """Atomically save users to JSON file and reset the journal"""
+    global _journal_records
+    with _journal_lock():
+        with atomic_open(USERS_FILE, 'wb') as f:
+            _dump_snapshot(users, f)
+        # replace rather than truncate, so the journal's identity changes
+        with atomic_open(JOURNAL_FILE, 'wb'):
+            pass
+        _journal_records = 0
+    get_user_store().invalidate()
+
+
+def compact_journal():
+    """
+    Fold the journal into the users snapshot.
+    Writers are only blocked while the snapshot is swapped in; records
+    appended while the new snapshot was being built are carried over.
+    """
+    global _journal_records
+    with _compact_lock:
+        with _journal_lock():
+            if not os.path.exists(JOURNAL_FILE):
+                return
+            offset = os.path.getsize(JOURNAL_FILE)
+            snapshot_sig = _file_signature(USERS_FILE)
+        if offset == 0:
+            return
+
+        users = _read_snapshot()
+        _replay_journal(users, limit=offset)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(USERS_FILE)),
+                                        suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            _dump_snapshot(users, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Same lock order as UserStore._transaction()
+        store = _user_store if isinstance(_user_store, UserStore) else None
+        with store._lock if store else nullcontext(), _journal_lock():
+            if (_file_signature(USERS_FILE) != snapshot_sig
+                    or os.path.getsize(JOURNAL_FILE) < offset):
+                # Another process compacted or saved in the meantime
+                os.remove(tmp_path)
+                return
+            if store:
+                store.refresh()
+            with open(JOURNAL_FILE, 'rb') as f:
+                f.seek(offset)
+                tail = f.read()
+            os.replace(tmp_path, USERS_FILE)
+            with atomic_open(JOURNAL_FILE, 'wb') as f:
+                f.write(tail)
+            _journal_records = len(tail.splitlines())
+            if store:
+                store.rebase(snapshot_sig, offset)
+
+
+def _count_journal_records():
+    if not os.path.exists(JOURNAL_FILE):
+        return 0
+    with open(JOURNAL_FILE, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def _file_id(f):
+    st_ = os.fstat(f.fileno())
+    return st_.st_dev, st_.st_ino
+
+
+def _append_journal(record):
+    """
+    Append one change record (not yet fsync'd; see _sync_journal).
+    Returns the (start, end) byte offsets of the record and an id for
+    the journal file it went into.
+    """
+    global _journal_records, _journal_seen, _journal_generation
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+    with _journal_lock():
+        if _journal_records is None:
+            _journal_records = _count_journal_records()
+        with open(JOURNAL_FILE, 'ab') as f:
+            start = f.tell()
+            try:
+                f.write(line.encode('utf-8'))
+                f.flush()
+            except OSError:
+                # don't leave a torn line for the next record to follow
+                f.truncate(start)
+                raise
+            end = f.tell()
+            file_id = _file_id(f)
+        # A different file, or the same inode number grown back from
+        # shorter than we left it, is a new journal
+        if file_id != _journal_seen[0] or start < _journal_seen[1]:
+            _journal_generation += 1
+        _journal_seen = (file_id, end)
+        journal_id = (file_id, _journal_generation)
+        _journal_records += 1
+        needs_compaction = _journal_records >= COMPACT_THRESHOLD
+
+    if needs_compaction and not _compact_lock.locked():
+        threading.Thread(target=compact_journal, daemon=True).start()
+    return start, end, journal_id
+
+
+def _sync_journal(position):
+    """
+    Make the journal durable up to `position`, a (journal id, end offset)
+    pair from UserStore.write().
+    Concurrent writers queue on _sync_lock; the first one through fsyncs
+    everything appended so far, so the rest usually return immediately.
+    """
+    global _synced_journal, _synced_offset
+    journal_id, end = position
+    with _sync_lock:
+        if _synced_journal == journal_id and _synced_offset >= end:
+            return
+        try:
+            with open(JOURNAL_FILE, 'rb') as f:
+                if _file_id(f) != journal_id[0]:
+                    # Replaced since the append: compaction or save_users()
+                    # wrote the record (or its successor) durably already
+                    return
+                size = os.fstat(f.fileno()).st_size
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            return
+        _synced_journal, _synced_offset = journal_id, size
+
+
+def _file_signature(path):
+    try:
+        st_ = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st_.st_mtime_ns, st_.st_size
+
+
+class UserStore:
+    """
+    Process-wide in-memory copy of the users snapshot plus journal.
+
+    The store is shared by every Streamlit session and rerun in the
+    process. It re-reads the snapshot only when its mtime/size changes
+    (other than by this process's own compactions, see rebase()) and
+    otherwise just applies journal records appended since the last
+    look, so the common read path does no disk I/O beyond two stat calls.
+
+    Users and bookings are held as slotted User/Booking records (see
+    utils.models), which take a fraction of the memory of the dicts
+    they are read from.
+
+    Cancelled bookings are left as None tombstones in the cached lists so
+    positions held by the booking-ID index stay valid; a user's list is
+    packed once tombstones make up half of it. Sold seats per trip are
+    tracked in a SeatInventory updated alongside the bookings.
+
+    A user's bookings in each history order are built on first request
+    and kept until their bookings change, so paging is a list slice.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+        # Secondary indexes: normalized email -> username,
+        # booking_id -> (username, position in that user's bookings)
+        self._emails = {}
+        self._booking_index = {}
+        self._tombstones = {}
+        # username -> {sort: live bookings in that order} (see bookings_page)
+        self._history = {}
+        self._seats = SeatInventory()
+        self._snapshot_sig = None
+        self._journal_offset = 0
+        self._loaded = False
+
+    def invalidate(self):
+        """Force a full reload on next access"""
+        with self._lock:
+            self._loaded = False
+
+    def _reload(self):
+        self._snapshot_sig = _file_signature(USERS_FILE)
+        self._users = {username: User.from_dict(user) for username, user in _iter_snapshot()}
+        self._emails = {}
+        self._booking_index = {}
+        self._tombstones = {}
+        self._history = {}
+        self._seats.clear()
+        for username, user in self._users.items():
+            self._emails.setdefault(normalize_email(user.get('email')), username)
+            self._index_bookings(username)
+        self._journal_offset = 0
+        self._apply_journal_tail()
+        self._loaded = True
+
+    def _index_bookings(self, username):
+        for pos, booking in enumerate(self._users[username].get('bookings', [])):
+            if booking is not None:
+                self._booking_index.setdefault(booking.get('booking_id'), (username, pos))
+                self._seats.add_booking(booking)
+
+    def _apply_journal_tail(self):
+        if not os.path.exists(JOURNAL_FILE):
+            return
+        with open(JOURNAL_FILE, 'rb') as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+        # Only consume complete lines; a partial line is still being written
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        self._journal_offset += complete
+
+    def _apply(self, record):
+        """Apply a record to the cache and keep the indexes in step"""
+        op = record.get('op')
+        username = record.get('username')
+        if op == 'booking':
+            user = self._users.get(username)
+            booking = Booking.from_dict(record['booking'])
+            loc = self._booking_index.get(booking.get('booking_id'))
+            if user is None or (loc and loc[0] == username):
+                return
+            bookings = user.get('bookings')
+            if bookings is None:
+                bookings = user.bookings = []
+            bookings.append(booking)
+            self._history.pop(username, None)
+            self._seats.add_booking(booking)
+            if loc is None:
+                self._booking_index[booking.get('booking_id')] = (username, len(bookings) - 1)
+        elif op == 'cancel':
+            matches = self._positions(username, record['booking_id'])
+            if len(matches) > record.get('remaining', 0):
+                self._drop(username, matches[0])
+        elif op == 'signup':
+            if username not in self._users:
+                self._users[username] = User.from_dict(record['user'])
+                self._emails.setdefault(normalize_email(self._users[username].get('email')), username)
+                self._index_bookings(username)
+        else:
+            _apply_record(self._users, record)
+
+    def _positions(self, username, booking_id):
+        """Positions of the user's live bookings with this ID, in order"""
+        return [pos for pos, booking in enumerate(self._users.get(username, {}).get('bookings', []))
+                if booking is not None and booking.get('booking_id') == booking_id]
+
+    def _drop(self, username, pos):
+        bookings = self._users[username].bookings
+        booking_id = bookings[pos].get('booking_id')
+        self._seats.remove_booking(bookings[pos])
+        bookings[pos] = None
+        if self._booking_index.get(booking_id) == (username, pos):
+            # point the ID at the user's next booking with it, if any
+            rest = self._positions(username, booking_id)
+            if rest:
+                self._booking_index[booking_id] = (username, rest[0])
+            else:
+                del self._booking_index[booking_id]
+        self._history.pop(username, None)
+        dead = self._tombstones.get(username, 0) + 1
+        if dead * 2 >= len(bookings):
+            self._pack(username)
+        else:
+            self._tombstones[username] = dead
+
+    def _pack(self, username):
+        """Remove tombstones from a user's list and re-index its positions"""
+        user = self._users[username]
+        for booking in user.bookings:
+            if booking is not None:
+                loc = self._booking_index.get(booking.booking_id)
+                if loc and loc[0] == username:
+                    del self._booking_index[booking.booking_id]
+        user.bookings = [b for b in user.bookings if b is not None]
+        self._tombstones.pop(username, None)
+        self._index_bookings(username)
+
+    def rebase(self, old_snapshot_sig, folded):
+        """
+        Follow a compaction done by this process, which folded the first
+        `folded` journal bytes into a new snapshot. The cached data is
+        unchanged, so only the file positions move; no reload.
+        Call with the store and journal locks held.
+        """
+        if self._loaded and self._snapshot_sig == old_snapshot_sig and self._journal_offset >= folded:
+            self._snapshot_sig = _file_signature(USERS_FILE)
+            self._journal_offset -= folded
+
+    def refresh(self):
+        """Bring the cache up to date with the files on disk"""
+        with self._lock:
+            if not self._loaded or _file_signature(USERS_FILE) != self._snapshot_sig:
+                self._reload()
+                return
+            journal_sig = _file_signature(JOURNAL_FILE)
+            journal_size = journal_sig[1] if journal_sig else 0
+            if journal_size < self._journal_offset:
+                # Journal was truncated by a compaction or save_users()
+                self._reload()
+            elif journal_size > self._journal_offset:
+                self._apply_journal_tail()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Hold the in-process and cross-process locks around a
+        check-then-write, so another session or process can't slip a
+        conflicting change in between (no lost updates).
+        """
+        with self._lock, _journal_lock():
+            self.refresh()
+            yield
+
+    def write(self, record):
+        """
+        Append a change record to the journal, then apply it locally.
+        If the append fails the cache is left untouched.
+        Returns the journal position to pass to _sync_journal().
+        """
+        with self._transaction():
+            start, end, journal_id = _append_journal(record)
+            self._apply(record)
+            if start == self._journal_offset:
+                self._journal_offset = end
+            return journal_id, end
+
+    # --- storage backend interface (shared with SQLiteUserStore) ---
+
+    def get(self, username):
+        """Return the user's fields (bookings are fetched via bookings())"""
+        self.refresh()
+        user = self._users.get(username)
+        if user is None:
+            return None
+        return user.fields()
+
+    def username_for_email(self, email):
+        self.refresh()
+        return self._emails.get(normalize_email(email))
+
+    def email_taken(self, email):
+        return self.username_for_email(email) is not None
+
+    def add_user(self, username, user):
+        with self._transaction():
+            if username in self._users or normalize_email(user.get('email')) in self._emails:
+                return False
+            position = self.write({'op': 'signup', 'username': username, 'user': user})
+        _sync_journal(position)
+        return True
+
+    def set_password(self, username, password):
+        _sync_journal(self.write({'op': 'password', 'username': username,
+                                  'password': password}))
+
+    def replace_passwords(self, changes):
+        """
+        Apply {username: (expected_old, new)} in one journal record.
+        Users whose password no longer matches expected_old are skipped.
+        """
+        if changes:
+            _sync_journal(self.write({
+                'op': 'passwords',
+                'passwords': {username: [_password_digest(old), new]
+                              for username, (old, new) in changes.items()}
+            }))
+
+    def iter_users(self):
+        """Yield (username, user fields) for every user"""
+        with self._lock:
+            self.refresh()
+            names = list(self._users)
+        for username in names:
+            user = self.get(username)
+            if user is not None:
+                yield username, user
+
+    def add_booking(self, username, booking):
+        """
+        Check the booking's seats are free and save it, atomically.
+        Returns (saved, seats_already_taken).
+        """
+        with self._transaction():
+            if username not in self._users:
+                return False, []
+            if holds_seats(booking):
+                taken = self._seats.conflicts(booking_trip_key(booking), booking.get('seats', []))
+                if taken:
+                    return False, taken
+            position = self.write({'op': 'booking', 'username': username, 'booking': booking})
+        _sync_journal(position)
+        return True, []
+
+    def remove_booking(self, username, booking_id):
+        """Cancel one booking; returns the removed Booking, or None"""
+        with self._transaction():
+            matches = self._positions(username, booking_id)
+            if not matches:
+                return None
+            booking = self._users[username].bookings[matches[0]]
+            position = self.write({'op': 'cancel', 'username': username,
+                                   'booking_id': booking_id, 'remaining': len(matches) - 1})
+        _sync_journal(position)
+        return booking
+
+    def find_booking(self, booking_id):
+        """Return (username, booking) for a booking ID, or None"""
+        with self._lock:
+            self.refresh()
+            loc = self._booking_index.get(booking_id)
+            if loc is None:
+                return None
+            username, pos = loc
+            return username, self._users[username].bookings[pos]
+
+    def seat_mask(self, key):
+        """Bitmap of sold seats for a trip_key()"""
+        self.refresh()
+        return self._seats.sold_mask(key)
+
+    def bookings(self, username):
+        with self._lock:
+            self.refresh()
+            bookings = self._users.get(username, {}).get('bookings', [])
+            return [b for b in bookings if b is not None]
+
+    def booking_count(self, username):
+        with self._lock:
+            self.refresh()
+            bookings = self._users.get(username, {}).get('bookings', [])
+            return len(bookings) - self._tombstones.get(username, 0)
+
+    def bookings_page(self, username, offset=0, limit=HISTORY_PAGE_SIZE, sort='date',
+                      descending=True):
+        """
+        One page of a user's bookings in `sort` order (see HISTORY_SORTS).
+        Returns (bookings, total).
+        """
+        if sort not in HISTORY_SORTS:
+            raise ValueError(f"unknown sort {sort!r}")
+        with self._lock:
+            self.refresh()
+            orders = self._history.setdefault(username, {})
+            order = orders.get(sort)
+            if order is None:
+                bookings = self._users.get(username, {}).get('bookings', [])
+                order = [b for b in bookings if b is not None]
+                if sort == 'date':
+                    order.sort(key=travel_order)   # stable: ties stay in booking order
+                orders[sort] = order
+        total = len(order)
+        if not descending:
+            return order[offset:offset + limit], total
+        end = max(total - offset, 0)
+        return order[max(end - limit, 0):end][::-1], total
+
+
+# Storage backend: "json" (users.json + journal) or "sqlite" (DB_FILE)
+STORAGE_BACKEND = os.environ.get('ZTRAVELS_STORAGE', 'json')
+DB_FILE = os.environ.get('ZTRAVELS_DB', 'users.db')
+
+_user_store = None
+_user_store_lock = threading.Lock()
+
+
+def get_user_store():
+    """Return the shared per-process user store for the configured backend"""
+    global _user_store
+    if _user_store is None:
+        with _user_store_lock:
+            if _user_store is None:
+                if STORAGE_BACKEND == 'sqlite':
+                    from utils.sqlite_store import SQLiteUserStore
+                    _user_store = SQLiteUserStore(DB_FILE)
+                else:
+                    _user_store = UserStore()
+    return _user_store
+
+
+def stream_all_users():
+    """
+    Yield (username, user with bookings) from the configured backend, for
+    offline jobs. The JSON backend streams users.json rather than loading
+    a UserStore.
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        store = get_user_store()
+        for username, user in store.iter_users():
+            yield username, dict(user, bookings=[b.to_dict() for b in store.bookings(username)])
+    else:
+        yield from stream_users()
+
+
+def stream_bookings():
+    """Yield (username, email, booking) for every booking"""
+    for username, user in stream_all_users():
+        for booking in user.get('bookings', []):
+            if booking is not None:
+                yield username, user.get('email'), booking
 
 
 def hash_password(password: str) -> str:
-    """Generate a bcrypt hash for a password"""
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    return hashed.decode('utf-8')
+    """Generate a bcrypt hash for a password (on the hashing pool)"""
+    return hashing.hash_password(password)
 
 
 def check_password(password: str, hashed: str) -> bool:
-    """Verify a password against a bcrypt hash"""
-    try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    except ValueError:
-        # Invalid/corrupted hash
-        return False
+    """Verify a password against a bcrypt hash (on the hashing pool)"""
+    return hashing.check_password(password, hashed)
+
+
+def is_password_hash(stored_pw: str) -> bool:
+    """Whether a stored password is a bcrypt hash (not legacy plain text)"""
+    return stored_pw.startswith("$2b$") or stored_pw.startswith("$2a$")
+
+
+BUSY_MESSAGE = "Server is busy, please try again in a moment."
 
 
 def signup(username: str, email: str, password: str, phone: str):
     """Register a new user with hashed password"""
-    users = load_users()
+    store = get_user_store()
 
-    if username in users:
+    if store.get(username) is not None:
         return False, "Username already exists!"
 
-    if any(user['email'] == email for user in users.values()):
+    if store.email_taken(email):
         return False, "Email already registered!"
 
-    users[username] = {
+    try:
+        hashed = hash_password(password)
+    except ServerBusy:
+        return False, BUSY_MESSAGE
+
+    created = store.add_user(username, {
         'email': email,
-        'password': hash_password(password),
+        'password': hashed,
         'phone': phone,
         'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'bookings': []
-    }
-
-    save_users(users)
+    })
+    if not created:
+        # Lost a race with a concurrent signup for the same name or email
+        return False, "Username or email already registered!"
     return True, "Account created successfully! Please login."
 
 
@@ -68,49 +810,132 @@ def login(username: str, password: str):
     Authenticate user with hashed password.
     Automatically migrate old plain-text passwords to bcrypt.
     """
-    users = load_users()
+    store = get_user_store()
+    user = store.get(username)
 
-    if username not in users:
+    if user is None:
         return False, "Username not found!"
 
-    stored_pw = users[username].get('password')
+    stored_pw = user.get('password')
     if not stored_pw:
         return False, "Password not set for this user!"
 
     # Check if password is already hashed
-    if stored_pw.startswith("$2b$") or stored_pw.startswith("$2a$"):
+    if is_password_hash(stored_pw):
         # Existing bcrypt hash
-        if check_password(password, stored_pw):
+        try:
+            valid = check_password(password, stored_pw)
+        except ServerBusy:
+            return False, BUSY_MESSAGE
+        if valid:
             return True, "Login successful!"
         else:
             return False, "Incorrect password!"
     else:
         # Old plain-text password detected
         if password == stored_pw:
-            # Automatically upgrade to bcrypt
-            users[username]['password'] = hash_password(password)
-            save_users(users)
+            # Automatically upgrade to bcrypt; if the pool is saturated the
+            # login still succeeds and the upgrade happens next time
+            try:
+                store.set_password(username, hash_password(password))
+            except ServerBusy:
+                return True, "Login successful!"
             return True, "Login successful! (Password upgraded to secure hash)"
         else:
             return False, "Incorrect password!"
 
 
+def get_user(username: str):
+    """Get a user's record from the shared store (read-only)"""
+    return get_user_store().get(username)
+
+
+def get_user_email(username: str) -> str:
+    """Get the registered email for a user"""
+    return (get_user(username) or {}).get('email', '')
+
+
+def get_username_by_email(email: str):
+    """Look up which user registered an email (case-insensitive)"""
+    return get_user_store().username_for_email(email)
+
+
 def get_user_bookings(username: str):
     """Get all bookings for a user"""
-    users = load_users()
-    return users.get(username, {}).get('bookings', [])
+    return get_user_store().bookings(username)
 
 
 def add_booking(username: str, booking_details: dict):
     """Add a booking to user's account"""
-    users = load_users()
-    if username in users:
-        users[username].setdefault('bookings', []).append(booking_details)
-        save_users(users)
-        return True
-    return False
+    saved, _ = get_user_store().add_booking(username, booking_details)
+    return saved
+
+
+def book_seats(username: str, booking_details: dict):
+    """
+    Reserve the booking's seats on its trip and save the booking in one
+    atomic step, so two sessions can't sell the same seat.
+    Returns (success: bool, message: str)
+    """
+    saved, taken = get_user_store().add_booking(username, booking_details)
+    if saved:
+        return True, "Booking confirmed!"
+    if taken:
+        return False, (f"Seat(s) {', '.join(map(str, taken))} were just booked by "
+                       "someone else. Please pick other seats.")
+    return False, "Username not found!"
+
+
+def get_sold_seats(from_city, to_city, date, departure_time, bus_type):
+    """Set of seat numbers already sold on a trip"""
+    key = trip_key(from_city, to_city, date, departure_time, bus_type)
+    return set(mask_to_seats(get_user_store().seat_mask(key)))
+
+
+def remove_booking(username: str, booking_id: str) -> bool:
+    """Remove (cancel) a booking from a user's account"""
+    booking = get_user_store().remove_booking(username, booking_id)
+    if booking is None:
+        return False
+    # a cancelled booking no longer counts against its code's usage cap
+    if booking.get('discount_code'):
+        release_discount(booking['discount_code'])
+    return True
+
+
+def get_booking(booking_id: str):
+    """Look up any booking by its ID without knowing the owner"""
+    found = get_user_store().find_booking(booking_id)
+    return found[1] if found else None
+
+
+def get_booking_owner(booking_id: str):
+    """Return the username that holds a booking ID, or None"""
+    found = get_user_store().find_booking(booking_id)
+    return found[0] if found else None
+
+
+def cancel_booking(booking_id: str):
+    """
+    Cancel a booking by ID, whoever owns it (e.g. for support staff).
+    Returns (success: bool, message: str)
+    """
+    found = get_user_store().find_booking(booking_id)
+    if found is None or not remove_booking(found[0], booking_id):
+        return False, "Booking not found!"
+    return True, "Booking cancelled."
+
+
+def get_booking_history(username: str, offset: int = 0, limit: int = HISTORY_PAGE_SIZE,
+                        sort: str = 'date', descending: bool = True):
+    """
+    One page of a user's bookings, newest first by default.
+    sort is 'date' (travel date) or 'booked' (when it was booked).
+    Returns (bookings, total number of bookings).
+    """
+    return get_user_store().bookings_page(username, offset, limit, sort, descending)
 
 
 def get_user_booking_count(username: str) -> int:
     """Get total number of bookings for a user"""
-    return len(get_user_bookings(username))
+    return get_user_store().booking_count(username)
@@ -0,0 +1,21 @@
+"""
+Discount codes with copy buttons, as a single custom component.
+
+All codes go to frontend/coupons/index.html in one payload and are
+drawn by one script in one iframe, so adding campaigns doesn't add
+frames or scripts to the booking page.
+"""
+import os
+
+import streamlit.components.v1 as components
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'frontend', 'coupons')
+_component = components.declare_component('coupon_panel', path=_FRONTEND_DIR)
+
+
+def coupon_panel(discounts, key='coupon_panel'):
+    """Render [{'code', 'description', ...}, ...] as one list of copyable codes"""
+    coupons = [{'code': d['code'], 'description': d.get('description', '')} for d in discounts]
+    if coupons:
+        _component(coupons=coupons, key=key, default=None)
@@ -0,0 +1,149 @@
+"""
+Discount codes loaded from discounts.json.
+
+Each entry is a rule:
+
+    {
+        "code": "DIWALI25",            # matched case-insensitively
+        "discount": 25,                # percent off
+        "description": "Diwali Special - 25% OFF",
+        "valid_from": "2026-10-01",    # optional, inclusive (booking date)
+        "valid_until": "2026-11-15",   # optional, inclusive
+        "max_uses": 500,               # optional cap on confirmed bookings
+        "routes": ["Mumbai-Delhi"],    # optional, "From-To" or "From-*"/"*-To"
+        "hidden": false                # optional, keep out of the coupon list
+    }
+
+The file is compiled once per change into a code -> rule dict, so a
+lookup is a single dict access however many codes there are. Usage
+counts live in discount_usage.json, updated under a file lock with an
+atomic replace, so users.json is never rewritten for a redemption.
+"""
+import json
+from datetime import date
+
+from utils.assets import cached_file
+from utils.fileio import atomic_open, file_lock
+
+DISCOUNTS_FILE = 'discounts.json'
+USAGE_FILE = 'discount_usage.json'
+
+
+def normalize_code(code) -> str:
+    return str(code or '').strip().upper()
+
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _compile_rules(data):
+    """Raw discounts.json bytes -> {code: rule}"""
+    table = {}
+    for raw in json.loads(data or b'[]'):
+        code = normalize_code(raw.get('code'))
+        if not code:
+            continue
+        routes = set()
+        for route in raw.get('routes') or ():
+            from_city, _, to_city = route.partition('-')
+            routes.add((from_city.strip() or '*', to_city.strip() or '*'))
+        table[code] = {
+            'code': code,
+            'discount': raw.get('discount', 0),
+            'description': raw.get('description', ''),
+            'valid_from': _parse_date(raw.get('valid_from')),
+            'valid_until': _parse_date(raw.get('valid_until')),
+            'max_uses': raw.get('max_uses'),
+            'routes': frozenset(routes),
+            'hidden': bool(raw.get('hidden')),
+        }
+    return table
+
+
+def load_rules():
+    """The compiled code -> rule table (rebuilt only when the file changes)"""
+    return cached_file(DISCOUNTS_FILE, 'discount-rules', _compile_rules) or {}
+
+
+def _read_usage():
+    try:
+        with open(USAGE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_usage(code) -> int:
+    """Confirmed bookings that used a code"""
+    usage = cached_file(USAGE_FILE, 'discount-usage', lambda data: json.loads(data or b'{}')) or {}
+    return usage.get(normalize_code(code), 0)
+
+
+def _route_matches(rule, from_city, to_city) -> bool:
+    routes = rule['routes']
+    return (not routes or (from_city, to_city) in routes
+            or (from_city, '*') in routes or ('*', to_city) in routes)
+
+
+def _in_window(rule, today) -> bool:
+    return ((rule['valid_from'] is None or rule['valid_from'] <= today)
+            and (rule['valid_until'] is None or today <= rule['valid_until']))
+
+
+def check_discount(code, from_city, to_city, today=None):
+    """
+    Validate a code for a route.
+    Returns (rule, None) if it applies, or (None, error message).
+    """
+    rule = load_rules().get(normalize_code(code))
+    if rule is None:
+        return None, "Invalid discount code!"
+    if not _in_window(rule, today or date.today()):
+        return None, "This discount code has expired or is not active yet."
+    if not _route_matches(rule, from_city, to_city):
+        return None, f"This discount code isn't valid from {from_city} to {to_city}."
+    if rule['max_uses'] is not None and get_usage(code) >= rule['max_uses']:
+        return None, "This discount code has been fully redeemed."
+    return rule, None
+
+
+def active_discounts(from_city=None, to_city=None, today=None):
+    """Visible rules usable today (on the route, when one is given)"""
+    today = today or date.today()
+    return [rule for rule in load_rules().values()
+            if not rule['hidden'] and _in_window(rule, today)
+            and (from_city is None or _route_matches(rule, from_city, to_city))
+            and (rule['max_uses'] is None or get_usage(rule['code']) < rule['max_uses'])]
+
+
+def redeem_discount(code, from_city, to_city, today=None):
+    """
+    Count one use of a code, atomically against its cap.
+    Returns (success, message).
+    """
+    code = normalize_code(code)
+    rule, error = check_discount(code, from_city, to_city, today)
+    if rule is None:
+        return False, error
+    with file_lock(USAGE_FILE):
+        usage = _read_usage()
+        used = usage.get(code, 0)
+        if rule['max_uses'] is not None and used >= rule['max_uses']:
+            return False, "This discount code has been fully redeemed."
+        usage[code] = used + 1
+        with atomic_open(USAGE_FILE) as f:
+            json.dump(usage, f, separators=(',', ':'))
+    return True, "Discount redeemed."
+
+
+def release_discount(code):
+    """Give back a use taken by redeem_discount (e.g. the booking failed)"""
+    code = normalize_code(code)
+    with file_lock(USAGE_FILE):
+        usage = _read_usage()
+        if usage.get(code, 0) <= 0:
+            return
+        usage[code] -= 1
+        with atomic_open(USAGE_FILE) as f:
+            json.dump(usage, f, separators=(',', ':'))
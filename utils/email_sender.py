@@ -1,133 +1,308 @@
+import html
+import re
 import smtplib
+import uuid
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
+from utils.mail_queue import MAIL_FROM, mail_configured, mail_queue
+
+_FIELD = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class Template:
+    """
+    A text template compiled once into its literal chunks and field
+    names, so rendering is one join. Fields are written {{name}}; values
+    go through `escape` (html.escape for HTML parts).
+    """
+
+    def __init__(self, source, escape=str):
+        parts = _FIELD.split(source)
+        self.literals = parts[0::2]
+        self.fields = parts[1::2]
+        self.escape = escape
+
+    def render(self, values):
+        escape = self.escape
+        out = [self.literals[0]]
+        for name, literal in zip(self.fields, self.literals[1:]):
+            out.append(escape(values.get(name, '')))
+            out.append(literal)
+        return ''.join(out)
+
+
+def _escape_html(value):
+    return html.escape(str(value), quote=False)
+
+
+class EmailTemplate:
+    """Subject, plain-text and HTML templates for one kind of email"""
+
+    def __init__(self, subject, text, html_source):
+        self.subject = Template(subject)
+        self.text = Template(text)
+        self.html = Template(html_source, escape=_escape_html)
+
+    def render(self, values):
+        """Return (subject, text, html) for one recipient"""
+        return self.subject.render(values), self.text.render(values), self.html.render(values)
+
+
+# Static skeleton shared by every HTML email: styles, frame and footer.
+# Only the header and body differ between templates.
+_PAGE_TOP = """<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px; }
+        .container { background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px; text-align: center; }
+        .details { margin: 20px 0; padding: 15px; background-color: #f8f9fa; border-radius: 5px; }
+        .detail-row { margin: 10px 0; padding: 8px; border-bottom: 1px solid #dee2e6; }
+        .label { font-weight: bold; color: #495057; }
+        .value { color: #212529; }
+        .footer { text-align: center; margin-top: 30px; color: #6c757d; font-size: 12px; }
+        .button { background-color: #28a745; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; display: inline-block; margin-top: 20px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+"""
+
+_PAGE_BOTTOM = """        <div class="footer">
+            <p>Thank you for choosing our service!</p>
+            <p>For any queries, contact us at support@busbooking.com</p>
+            <p>&copy; 2024 Bus Booking Service. All rights reserved.</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+_TEXT_FOOTER = """
+Thank you for choosing our service!
+For any queries, contact us at support@busbooking.com
+"""
+
+
+def html_page(header, body):
+    """Template source for a full HTML email around a header and body"""
+    return _PAGE_TOP + header + body + _PAGE_BOTTOM
+
+
+CONFIRMATION_EMAIL = EmailTemplate(
+    subject="Booking Confirmed - {{booking_id}}",
+    text="""Booking Confirmed!
+
+Booking ID:     {{booking_id}}
+From:           {{from_city}}
+To:             {{to_city}}
+Date:           {{date}}
+Passengers:     {{passengers}}
+Seats:          {{seats}}
+Bus Type:       {{bus_type}}
+
+Bus Number:     {{bus_number}}
+Driver Contact: {{driver_number}}
+
+Total Amount:   Rs. {{total_amount}}
+Discount:       {{discount}}%
+Payment Mode:   Cash on Boarding
+
+Please arrive at the boarding point 15 minutes before departure.
+""" + _TEXT_FOOTER,
+    html_source=html_page("""        <div class="header">
+            <h1>🎉 Booking Confirmed! 🎉</h1>
+            <p>Your journey awaits!</p>
+        </div>
+
+""", """        <div class="details">
+            <h2>Booking Details</h2>
+            <div class="detail-row">
+                <span class="label">Booking ID:</span>
+                <span class="value">{{booking_id}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">From:</span>
+                <span class="value">{{from_city}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">To:</span>
+                <span class="value">{{to_city}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Date:</span>
+                <span class="value">{{date}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Passengers:</span>
+                <span class="value">{{passengers}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Seats:</span>
+                <span class="value">{{seats}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Bus Type:</span>
+                <span class="value">{{bus_type}}</span>
+            </div>
+        </div>
+
+        <div class="details" style="background-color: #fff3cd; border-left: 4px solid #ffc107;">
+            <h3>🚌 Travel Information</h3>
+            <div class="detail-row">
+                <span class="label">Bus Number:</span>
+                <span class="value" style="font-size: 18px; color: #d63384;">{{bus_number}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Driver Contact:</span>
+                <span class="value" style="font-size: 18px; color: #d63384;">{{driver_number}}</span>
+            </div>
+        </div>
+
+        <div class="details" style="background-color: #d1ecf1; border-left: 4px solid #0dcaf0;">
+            <h3>💰 Payment Details</h3>
+            <div class="detail-row">
+                <span class="label">Total Amount:</span>
+                <span class="value">₹{{total_amount}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Discount Applied:</span>
+                <span class="value">{{discount}}%</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Payment Mode:</span>
+                <span class="value">Cash on Boarding</span>
+            </div>
+        </div>
+
+        <div style="text-align: center; margin-top: 30px;">
+            <p style="font-size: 18px; color: #28a745; font-weight: bold;">
+                ✅ Your booking is confirmed!
+            </p>
+            <p style="font-size: 14px; color: #6c757d;">
+                Please arrive at the boarding point 15 minutes before departure.
+            </p>
+        </div>
+
+"""),
+)
+
+
+REMINDER_EMAIL = EmailTemplate(
+    subject="Trip reminder: {{from_city}} to {{to_city}} at {{departure_time}}",
+    text="""Your bus leaves soon!
+
+{{from_city}} to {{to_city}}
+Date:           {{date}}
+Departure:      {{departure_time}}
+Seats:          {{seats}}
+Bus Number:     {{bus_number}}
+Driver Contact: {{driver_number}}
+Booking ID:     {{booking_id}}
+
+Please arrive at the boarding point 15 minutes before departure.
+""" + _TEXT_FOOTER,
+    html_source=html_page("""        <div class="header">
+            <h1>🚌 Your bus leaves soon!</h1>
+            <p>{{from_city}} to {{to_city}}</p>
+        </div>
+
+""", """        <div class="details">
+            <div class="detail-row">
+                <span class="label">Date:</span>
+                <span class="value">{{date}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Departure:</span>
+                <span class="value">{{departure_time}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Seats:</span>
+                <span class="value">{{seats}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Bus Number:</span>
+                <span class="value">{{bus_number}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Driver Contact:</span>
+                <span class="value">{{driver_number}}</span>
+            </div>
+            <div class="detail-row">
+                <span class="label">Booking ID:</span>
+                <span class="value">{{booking_id}}</span>
+            </div>
+        </div>
+
+        <div style="text-align: center; margin-top: 30px;">
+            <p style="font-size: 14px; color: #6c757d;">
+                Please arrive at the boarding point 15 minutes before departure.
+            </p>
+        </div>
+
+"""),
+)
+
+
+def build_message(to, subject, text, html_body, sender=MAIL_FROM):
+    """Assemble a multipart/alternative email (plain text + HTML)"""
+    # a fresh random boundary up front saves the generator from scanning
+    # both bodies for a collision-free one
+    message = MIMEMultipart('alternative', boundary='=_' + uuid.uuid4().hex)
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = to
+    message.attach(MIMEText(text, 'plain', 'utf-8'))
+    message.attach(MIMEText(html_body, 'html', 'utf-8'))
+    return message
+
+
+def booking_fields(user_email, booking_details):
+    """Template values for a booking, with the same fallbacks as before"""
+    return {
+        'booking_id': booking_details.get('booking_id', 'N/A'),
+        'from_city': booking_details.get('from_city', 'N/A'),
+        'to_city': booking_details.get('to_city', 'N/A'),
+        'date': booking_details.get('date', 'N/A'),
+        'departure_time': booking_details.get('departure_time', 'N/A'),
+        'passengers': booking_details.get('passengers', 'N/A'),
+        'seats': ', '.join(map(str, booking_details.get('seats', []))),
+        'bus_type': booking_details.get('bus_type', 'N/A'),
+        'bus_number': booking_details.get('bus_number', 'BUS-' + str(hash(user_email))[-6:]),
+        'driver_number': booking_details.get('driver_number', '+91-98765-43210'),
+        'total_amount': booking_details.get('total_amount', 'N/A'),
+        'discount': booking_details.get('discount', '0'),
+    }
+
 
 def send_confirmation_email(user_email, booking_details):
     """
     Send booking confirmation email to user
     """
     try:
-        # Email configuration (you'll need to set up your SMTP server)
-        # For demo purposes, this will just return the email content
-
-        bus_number = booking_details.get(
-            'bus_number', 'BUS-' + str(hash(user_email))[-6:])
-        driver_number = booking_details.get(
-            'driver_number', '+91-98765-43210', 'driver_name', 'Mr.sharma')
-
-        email_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px; }}
-                .container {{ background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px; text-align: center; }}
-                .details {{ margin: 20px 0; padding: 15px; background-color: #f8f9fa; border-radius: 5px; }}
-                .detail-row {{ margin: 10px 0; padding: 8px; border-bottom: 1px solid #dee2e6; }}
-                .label {{ font-weight: bold; color: #495057; }}
-                .value {{ color: #212529; }}
-                .footer {{ text-align: center; margin-top: 30px; color: #6c757d; font-size: 12px; }}
-                .button {{ background-color: #28a745; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; display: inline-block; margin-top: 20px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🎉 Booking Confirmed! 🎉</h1>
-                    <p>Your journey awaits!</p>
-                </div>
-                
-                <div class="details">
-                    <h2>Booking Details</h2>
-                    <div class="detail-row">
-                        <span class="label">Booking ID:</span>
-                        <span class="value">{booking_details.get('booking_id', 'N/A')}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">From:</span>
-                        <span class="value">{booking_details.get('from_city', 'N/A')}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">To:</span>
-                        <span class="value">{booking_details.get('to_city', 'N/A')}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Date:</span>
-                        <span class="value">{booking_details.get('date', 'N/A')}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Passengers:</span>
-                        <span class="value">{booking_details.get('passengers', 'N/A')}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Seats:</span>
-                        <span class="value">{', '.join(map(str, booking_details.get('seats', [])))}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Bus Type:</span>
-                        <span class="value">{booking_details.get('bus_type', 'N/A')}</span>
-                    </div>
-                </div>
-                
-                <div class="details" style="background-color: #fff3cd; border-left: 4px solid #ffc107;">
-                    <h3>🚌 Travel Information</h3>
-                    <div class="detail-row">
-                        <span class="label">Bus Number:</span>
-                        <span class="value" style="font-size: 18px; color: #d63384;">{bus_number}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Driver Contact:</span>
-                        <span class="value" style="font-size: 18px; color: #d63384;">{driver_number}</span>
-                    </div>
-                </div>
-                
-                <div class="details" style="background-color: #d1ecf1; border-left: 4px solid #0dcaf0;">
-                    <h3>💰 Payment Details</h3>
-                    <div class="detail-row">
-                        <span class="label">Total Amount:</span>
-                        <span class="value">₹{booking_details.get('total_amount', 'N/A')}</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Discount Applied:</span>
-                        <span class="value">{booking_details.get('discount', '0')}%</span>
-                    </div>
-                    <div class="detail-row">
-                        <span class="label">Payment Mode:</span>
-                        <span class="value">Cash on Boarding</span>
-                    </div>
-                </div>
-                
-                <div style="text-align: center; margin-top: 30px;">
-                    <p style="font-size: 18px; color: #28a745; font-weight: bold;">
-                        ✅ Your booking is confirmed!
-                    </p>
-                    <p style="font-size: 14px; color: #6c757d;">
-                        Please arrive at the boarding point 15 minutes before departure.
-                    </p>
-                </div>
-                
-                <div class="footer">
-                    <p>Thank you for choosing our service!</p>
-                    <p>For any queries, contact us at support@busbooking.com</p>
-                    <p>&copy; 2024 Bus Booking Service. All rights reserved.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-
-        # In a real application, you would send this via SMTP
-        # For now, we'll just return the content
-        return {
+        fields = booking_fields(user_email, booking_details)
+        subject, text, email_content = CONFIRMATION_EMAIL.render(fields)
+
+        result = {
             'success': True,
+            'queued': False,
             'message': 'Email would be sent in production',
             'email_content': email_content,
-            'bus_number': bus_number,
-            'driver_number': driver_number
+            'bus_number': fields['bus_number'],
+            'driver_number': fields['driver_number']
         }
 
+        # With an SMTP server configured the message goes to the outbound
+        # queue; delivery (and any retries) happen off the request thread
+        if mail_configured() and user_email:
+            message = build_message(user_email, subject, text, email_content)
+            result['message_id'] = mail_queue.enqueue(user_email, message)
+            result['queued'] = True
+            result['message'] = 'Confirmation email queued'
+        return result
+
     except Exception as e:
         return {
             'success': False,
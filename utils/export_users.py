@@ -0,0 +1,45 @@
+"""
+Human-readable export of every user and their bookings.
+
+The live snapshot is written compactly (see SNAPSHOT_FORMAT in
+utils.auth). This writes an indented, key-sorted JSON copy for reading
+or diffing instead. Users are streamed one at a time, so the export
+works on stores of any size and from either storage backend.
+
+    python -m utils.export_users [OUTPUT]      (default: stdout)
+"""
+import argparse
+import json
+import sys
+
+from utils.auth import stream_all_users
+
+
+def export_users(out):
+    """Write all users to text file `out` as indented JSON; returns the count"""
+    count = 0
+    out.write('{')
+    for username, user in stream_all_users():
+        # nest each user one level in, as json.dump(indent=4) would
+        body = json.dumps(user, indent=4, sort_keys=True, ensure_ascii=False).replace('\n', '\n    ')
+        out.write(',\n' if count else '\n')
+        out.write(f"    {json.dumps(username, ensure_ascii=False)}: {body}")
+        count += 1
+    out.write('\n}\n' if count else '}\n')
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export users as readable JSON")
+    parser.add_argument('output', nargs='?', help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.output is None:
+        export_users(sys.stdout)
+        return
+    with open(args.output, 'w', encoding='utf-8') as f:
+        count = export_users(f)
+    print(f"Exported {count} users to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+bcrypt hashing on a bounded process pool.
+
+bcrypt is CPU-bound (100-300 ms per call at the default cost), so it
+runs in worker processes instead of on the Streamlit script thread and
+a login burst can use every core. At most MAX_PENDING calls may be
+queued or running; beyond that callers get ServerBusy straight away
+instead of piling up. A call that times out, or whose worker died,
+also raises ServerBusy; a pool broken by a dead worker is replaced on
+the next call.
+
+Workers are started with "spawn", so command-line scripts that hash
+passwords need the usual `if __name__ == '__main__':` guard.
+
+Settings (environment):
+    ZTRAVELS_BCRYPT_ROUNDS   bcrypt cost factor for new hashes (default 12)
+    ZTRAVELS_HASH_WORKERS    worker processes (default: CPU count)
+    ZTRAVELS_HASH_QUEUE      max queued + running calls (default 4 x workers)
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('ZTRAVELS_BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.environ.get('ZTRAVELS_HASH_WORKERS', os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get('ZTRAVELS_HASH_QUEUE', HASH_WORKERS * 4))
+
+# Upper bound on how long a caller waits for its result
+RESULT_TIMEOUT = 30
+
+
+class ServerBusy(Exception):
+    """Raised when a hashing request can't be served right now"""
+
+
+def _hash_worker(password: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_worker(password: bytes, hashed: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        # Invalid/corrupted hash
+        return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking the multi-threaded Streamlit server is unsafe
+                _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next call starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(fn, *args):
+    """Submit to the shared pool; returns (pool, future)"""
+    pool = _get_pool()
+    try:
+        return pool, pool.submit(fn, *args)
+    except BrokenProcessPool:
+        # a worker died (e.g. OOM-killed) since the last call
+        _discard_pool(pool)
+        pool = _get_pool()
+        return pool, pool.submit(fn, *args)
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise ServerBusy("Too many login/signup requests in progress")
+    try:
+        pool, future = _submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=RESULT_TIMEOUT)
+    except TimeoutError:
+        raise ServerBusy("Password check timed out") from None
+    except BrokenProcessPool as e:
+        _discard_pool(pool)
+        raise ServerBusy("Password worker stopped unexpectedly") from e
+
+
+def hash_password(password: str, rounds: int = None) -> str:
+    """Generate a bcrypt hash for a password (raises ServerBusy)"""
+    return _run(_hash_worker, password.encode('utf-8'), rounds or BCRYPT_ROUNDS)
+
+
+def check_password(password: str, hashed: str) -> bool:
+    """Verify a password against a bcrypt hash (raises ServerBusy)"""
+    return _run(_check_worker, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def shutdown():
+    """Stop the worker processes (they restart on next use)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def hash_many(passwords, rounds: int = None, workers: int = None, chunksize: int = 16):
+    """
+    Hash many passwords on a dedicated pool (for offline batch jobs).
+    Yields hashes in input order; bypasses the request queue limit.
+    """
+    rounds = rounds or BCRYPT_ROUNDS
+    with ProcessPoolExecutor(max_workers=workers or HASH_WORKERS,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from pool.map(_hash_worker, (p.encode('utf-8') for p in passwords),
+                            itertools.repeat(rounds), chunksize=chunksize)
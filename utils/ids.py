@@ -0,0 +1,133 @@
+"""
+Booking ID generation.
+
+IDs are Snowflake-style 63-bit integers: milliseconds since EPOCH_MS,
+a node ID unique to the process and a per-millisecond sequence. They
+are rendered as "BK" + 13 base-36 digits, so string order is creation
+order and no "generate then check for duplicates" loop is needed.
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Processes on one host claim distinct node IDs by locking a file here
+NODE_LOCK_DIR = '.ztravels_nodes'
+
+ID_PREFIX = 'BK'
+ID_WIDTH = 13
+_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _claim_node_id():
+    """
+    Pick this process's node ID.
+    ZTRAVELS_NODE_ID wins if set (needed when several hosts share data);
+    otherwise hold a lock on the first free slot file for the process
+    lifetime, starting from a host/pid hash to keep probing short.
+    """
+    env = os.environ.get('ZTRAVELS_NODE_ID')
+    if env is not None:
+        return int(env) & MAX_NODE, None
+
+    seed = hashlib.blake2b(f"{socket.gethostname()}:{os.getpid()}".encode(),
+                           digest_size=4).digest()
+    start = int.from_bytes(seed, 'big') & MAX_NODE
+    if fcntl is None:
+        return start, None
+
+    os.makedirs(NODE_LOCK_DIR, exist_ok=True)
+    for i in range(MAX_NODE + 1):
+        node = (start + i) & MAX_NODE
+        fd = os.open(os.path.join(NODE_LOCK_DIR, f"{node}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return node, fd
+        except OSError:
+            os.close(fd)
+    raise RuntimeError("No free booking ID node slots")
+
+
+def _to_base36(n, width):
+    out = []
+    while n:
+        n, r = divmod(n, 36)
+        out.append(_DIGITS[r])
+    return ''.join(reversed(out)).rjust(width, '0')
+
+
+class IdGenerator:
+    """Thread-safe Snowflake-style generator; one per process"""
+
+    def __init__(self, node_id=None):
+        if node_id is None:
+            node_id, self._node_fd = _claim_node_id()
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_int(self) -> int:
+        with self._lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now < self._last_ms:
+                # Clock stepped backwards; keep issuing from the last timestamp
+                now = self._last_ms
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 4096 IDs this millisecond; move on to the next one
+                    now = self._last_ms + 1
+                    while int(time.time() * 1000) - EPOCH_MS < now:
+                        time.sleep(0.0001)
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def next_id(self) -> str:
+        return ID_PREFIX + _to_base36(self.next_int(), ID_WIDTH)
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def new_booking_id() -> str:
+    """Return a new unique, time-sortable booking ID"""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = IdGenerator()
+    return _generator.next_id()
+
+
+def _trip_digest(from_city, to_city, date, departure_time, bus_type):
+    key = '|'.join(map(str, (from_city, to_city, date, departure_time, bus_type)))
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+def trip_bus_number(from_city, to_city, date, departure_time, bus_type) -> str:
+    """Bus assigned to a trip; every booking on the trip gets the same one"""
+    digest = _trip_digest(from_city, to_city, date, departure_time, bus_type)
+    return f"BUS-{1000 + digest % 9000}"
+
+
+def trip_driver_number(from_city, to_city, date, departure_time, bus_type) -> str:
+    """Driver contact for a trip"""
+    digest = _trip_digest(from_city, to_city, date, departure_time, bus_type) >> 16
+    return f"+91-{70000 + digest % 30000}-{10000 + (digest >> 20) % 90000}"
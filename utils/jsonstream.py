@@ -0,0 +1,101 @@
+"""
+Streaming reads of a large top-level JSON object ({"key": value, ...}).
+
+iter_items() parses one member at a time from fixed-size chunks, so
+memory use is bounded by the largest single value rather than the file.
+"""
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 1 << 20
+
+_WS = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Text buffer over a binary file that tracks byte offsets"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0          # index into text
+        self.offset = 0       # byte offset of text[pos] in the file
+        self.eof = False
+
+    def more(self):
+        """Read another chunk; False at end of file"""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        self.eof = not data
+        # drop what has been consumed so the buffer stays one value wide
+        self.text = self.text[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof or bool(self.text)
+
+    def advance(self, end):
+        consumed = self.text[self.pos:end]
+        self.offset += len(consumed) if consumed.isascii() else len(consumed.encode('utf-8'))
+        self.pos = end
+
+    def skip_ws(self):
+        while True:
+            self.advance(_WS.match(self.text, self.pos).end())
+            if self.pos < len(self.text) or not self.more():
+                return
+
+    def expect(self, chars):
+        self.skip_ws()
+        if self.pos >= len(self.text) or self.text[self.pos] not in chars:
+            found = self.text[self.pos:self.pos + 20] or 'end of file'
+            raise ValueError(f"expected {chars!r} at byte {self.offset}, found {found!r}")
+        char = self.text[self.pos]
+        self.advance(self.pos + 1)
+        return char
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete"""
+        self.skip_ws()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # a value that runs to the end of the buffer may continue
+                if end < len(self.text) or self.eof:
+                    break
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"invalid JSON at byte {self.offset}: {e.msg}") from e
+            self.more()
+        self.advance(end)
+        return value
+
+
+def iter_items(f, chunk_size=CHUNK_SIZE):
+    """
+    Yield (key, value, start, end) for each member of the JSON object in
+    binary file `f`. [start, end) is the byte range of `"key": value`.
+    An empty file counts as an empty object.
+    """
+    reader = _Reader(f, chunk_size)
+    reader.skip_ws()
+    if not reader.text:
+        return
+    reader.expect('{')
+    reader.skip_ws()
+    if reader.text.startswith('}', reader.pos):
+        return
+    while True:
+        reader.skip_ws()
+        start = reader.offset
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError(f"expected a string key at byte {start}")
+        reader.expect(':')
+        value = reader.value()
+        yield key, value, start, reader.offset
+        if reader.expect(',}') == '}':
+            return
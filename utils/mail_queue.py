@@ -0,0 +1,382 @@
+"""
+Durable outbound mail queue.
+
+enqueue() writes the message to a spool directory and returns at once;
+background worker threads deliver it over SMTP. Each worker keeps one
+SMTP connection open and reuses it for the next message. A failed send
+is retried with exponential backoff, and a message that keeps failing
+(or is rejected outright) goes to a dead-letter file. The spool survives
+restarts, and several processes can share it: a worker claims a message
+by renaming it into sending/ before it sends it.
+
+    mail_spool/outbox/<id>.json    waiting (or waiting for a retry)
+    mail_spool/sending/<id>.json   claimed by a worker
+    mail_spool/dead.jsonl          given up on
+
+Settings (environment):
+    ZTRAVELS_SMTP_HOST       SMTP server; unset means demo mode (nothing is sent)
+    ZTRAVELS_SMTP_PORT       default 25
+    ZTRAVELS_SMTP_USER       optional login, with ZTRAVELS_SMTP_PASSWORD
+    ZTRAVELS_SMTP_STARTTLS   "1" to upgrade the connection with STARTTLS
+    ZTRAVELS_MAIL_FROM       sender address
+    ZTRAVELS_MAIL_WORKERS    sender threads per process (default 2)
+    ZTRAVELS_MAIL_SPOOL      spool directory (default mail_spool)
+
+To try it locally, run a debugging SMTP server that prints what it gets:
+
+    python -m aiosmtpd -n -l localhost:1025
+    (Python <= 3.11 also has: python -m smtpd -n -c DebuggingServer localhost:1025)
+    ZTRAVELS_SMTP_HOST=localhost ZTRAVELS_SMTP_PORT=1025 streamlit run app.py
+
+and `python -m utils.mail_queue run` delivers whatever is left in the spool.
+"""
+import argparse
+import heapq
+import json
+import os
+import smtplib
+import threading
+import time
+import uuid
+
+from utils.fileio import atomic_open, file_lock
+
+SMTP_HOST = os.environ.get('ZTRAVELS_SMTP_HOST', '')
+SMTP_PORT = int(os.environ.get('ZTRAVELS_SMTP_PORT', 25))
+SMTP_USER = os.environ.get('ZTRAVELS_SMTP_USER', '')
+SMTP_PASSWORD = os.environ.get('ZTRAVELS_SMTP_PASSWORD', '')
+SMTP_STARTTLS = os.environ.get('ZTRAVELS_SMTP_STARTTLS', '') == '1'
+SMTP_TIMEOUT = 30
+MAIL_FROM = os.environ.get('ZTRAVELS_MAIL_FROM', 'ZTravels <no-reply@ztravels.local>')
+MAIL_WORKERS = int(os.environ.get('ZTRAVELS_MAIL_WORKERS', 2))
+SPOOL_DIR = os.environ.get('ZTRAVELS_MAIL_SPOOL', 'mail_spool')
+
+# Retry after 30s, 1m, 2m, ... (at most an hour apart), then dead-letter
+MAX_ATTEMPTS = 8
+RETRY_BASE = 30
+RETRY_CAP = 3600
+
+# A claim older than this was left by a worker that died mid-send
+STALE_CLAIM = 600
+# How often workers look for messages spooled by other processes
+RESCAN_EVERY = 30
+# A pooled connection idle longer than this is checked with NOOP first
+CONNECTION_IDLE = 60
+
+
+def mail_configured() -> bool:
+    return bool(SMTP_HOST)
+
+
+def smtp_connect():
+    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        smtp.starttls()
+    if SMTP_USER:
+        smtp.login(SMTP_USER, SMTP_PASSWORD)
+    return smtp
+
+
+def _permanent(error) -> bool:
+    """Errors that retrying won't fix (5xx replies, all recipients refused)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class PooledConnection:
+    """One worker's SMTP connection, kept open between messages"""
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _get(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > CONNECTION_IDLE:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except smtplib.SMTPException:
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def send(self, sender, recipients, raw):
+        # a pooled connection may have been dropped by the server; one
+        # reconnect is part of the send, anything else is a failed attempt
+        for retry in (False, True):
+            smtp = self._get()
+            try:
+                smtp.sendmail(sender, recipients, raw.encode('utf-8'))
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if retry:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+class MailQueue:
+    """Spool-backed queue drained by a few sender threads"""
+
+    def __init__(self, spool_dir=SPOOL_DIR, workers=MAIL_WORKERS, connect=smtp_connect,
+                 clock=time.time):
+        self.outbox = os.path.join(spool_dir, 'outbox')
+        self.sending = os.path.join(spool_dir, 'sending')
+        self.dead_file = os.path.join(spool_dir, 'dead.jsonl')
+        self._connect = connect
+        self._clock = clock
+        self._workers = workers
+        self._threads = []
+        self._cond = threading.Condition()
+        self._heap = []        # (not_before, message id)
+        self._queued = set()   # ids in the heap
+        self._in_flight = 0
+        self._last_scan = 0.0
+        self._stopping = False
+
+    def _ensure_dirs(self):
+        os.makedirs(self.outbox, exist_ok=True)
+        os.makedirs(self.sending, exist_ok=True)
+
+    def _write(self, record):
+        with atomic_open(os.path.join(self.outbox, record['id'] + '.json')) as f:
+            json.dump(record, f, separators=(',', ':'))
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _push(self, not_before, message_id):
+        if message_id not in self._queued:
+            self._queued.add(message_id)
+            heapq.heappush(self._heap, (not_before, message_id))
+
+    def enqueue(self, recipients, message) -> str:
+        """
+        Spool an email.message.Message for delivery and return its id.
+        Only a small local file write happens on the caller's thread.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        now = self._clock()
+        record = {
+            'id': f"{int(now * 1000):013d}-{uuid.uuid4().hex[:12]}",
+            'sender': message.get('From') or MAIL_FROM,
+            'recipients': list(recipients),
+            'raw': message.as_string(),
+            'attempts': 0,
+            'not_before': now,
+            'created': now,
+            'last_error': None,
+        }
+        self._ensure_dirs()
+        self._write(record)
+        with self._cond:
+            self._push(record['not_before'], record['id'])
+            self._start_workers()
+            self._cond.notify()
+        return record['id']
+
+    def scan(self):
+        """
+        Queue spooled messages this process doesn't know about yet (left
+        by a restart or another process) and recover stale claims.
+        """
+        self._ensure_dirs()
+        now = self._clock()
+        for name in os.listdir(self.sending):
+            path = os.path.join(self.sending, name)
+            try:
+                if now - os.path.getmtime(path) > STALE_CLAIM:
+                    os.replace(path, os.path.join(self.outbox, name))
+            except OSError:
+                pass
+        with self._cond:
+            known = set(self._queued)
+        found = []
+        for name in os.listdir(self.outbox):
+            message_id, ext = os.path.splitext(name)
+            if ext != '.json' or message_id in known:
+                continue
+            record = self._read(os.path.join(self.outbox, name))
+            if record is not None:
+                found.append((record.get('not_before', 0), message_id))
+        with self._cond:
+            for not_before, message_id in found:
+                self._push(not_before, message_id)
+            self._last_scan = now
+            if found:
+                self._cond.notify_all()
+        return len(found)
+
+    def start(self):
+        """Start the sender threads (and pick up the spool) if not running"""
+        with self._cond:
+            if self._threads and all(t.is_alive() for t in self._threads):
+                return
+        self.scan()
+        with self._cond:
+            self._start_workers()
+
+    def _start_workers(self):
+        self._stopping = False
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(target=self._work, name=f'mail-sender-{len(self._threads)}',
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def pending(self) -> int:
+        """Messages waiting in the spool (including claimed ones)"""
+        self._ensure_dirs()
+        return len(os.listdir(self.outbox)) + len(os.listdir(self.sending))
+
+    def _next(self):
+        """Pop a due message id, waiting a while for one; None if nothing is due"""
+        with self._cond:
+            if self._stopping:
+                return None
+            now = self._clock()
+            if self._heap and self._heap[0][0] <= now:
+                _, message_id = heapq.heappop(self._heap)
+                self._queued.discard(message_id)
+                self._in_flight += 1
+                return message_id
+            wait = RESCAN_EVERY - (now - self._last_scan)
+            if self._heap:
+                wait = min(wait, self._heap[0][0] - now)
+            if wait > 0:
+                self._cond.wait(wait)
+            return None
+
+    def _work(self):
+        connection = PooledConnection(self._connect)
+        try:
+            while not self._stopping:
+                if self._clock() - self._last_scan >= RESCAN_EVERY:
+                    self.scan()
+                message_id = self._next()
+                if message_id is not None:
+                    try:
+                        self._deliver(message_id, connection)
+                    finally:
+                        with self._cond:
+                            self._in_flight -= 1
+                            self._cond.notify_all()
+        finally:
+            connection.close()
+
+    def _deliver(self, message_id, connection):
+        name = message_id + '.json'
+        claimed = os.path.join(self.sending, name)
+        try:
+            os.rename(os.path.join(self.outbox, name), claimed)
+            os.utime(claimed)  # the claim's age is what marks it stale
+        except OSError:
+            return  # another worker got there first
+        record = self._read(claimed)
+        if record is None:
+            self._dead_letter({'id': message_id, 'last_error': 'unreadable spool file'})
+            os.remove(claimed)
+            return
+        try:
+            connection.send(record['sender'], record['recipients'], record['raw'])
+        except Exception as error:
+            self._failed(record, claimed, error)
+        else:
+            os.remove(claimed)
+
+    def _failed(self, record, claimed, error):
+        record['attempts'] += 1
+        record['last_error'] = f"{type(error).__name__}: {error}"
+        if record['attempts'] >= MAX_ATTEMPTS or _permanent(error):
+            self._dead_letter(record)
+            os.remove(claimed)
+            return
+        delay = min(RETRY_BASE * 2 ** (record['attempts'] - 1), RETRY_CAP)
+        record['not_before'] = self._clock() + delay
+        self._write(record)
+        os.remove(claimed)
+        with self._cond:
+            self._push(record['not_before'], record['id'])
+            self._cond.notify()
+
+    def _dead_letter(self, record):
+        record = dict(record, failed_at=self._clock())
+        with file_lock(self.dead_file):
+            with open(self.dead_file, 'a') as f:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def drain(self, timeout=None):
+        """
+        Wait until every message that is due has been tried (retries
+        scheduled for later stay in the spool). Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight or (self._heap and self._heap[0][0] <= self._clock()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(0.2 if remaining is None else min(remaining, 0.2))
+        return True
+
+
+mail_queue = MailQueue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outbound mail spool")
+    parser.add_argument('command', choices=['run', 'status'],
+                        help="run: deliver the spool and exit; status: show counts")
+    parser.add_argument('--forever', action='store_true',
+                        help="with run: keep delivering new mail instead of exiting")
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        dead = 0
+        if os.path.exists(mail_queue.dead_file):
+            with open(mail_queue.dead_file) as f:
+                dead = sum(1 for _ in f)
+        print(f"{mail_queue.pending()} pending, {dead} dead-lettered")
+        return
+    if not mail_configured():
+        parser.error("set ZTRAVELS_SMTP_HOST to deliver mail")
+    mail_queue.start()
+    if args.forever:
+        while True:
+            time.sleep(3600)
+    # retries wait in the spool; exit once everything due has been tried
+    mail_queue.drain()
+    mail_queue.stop(timeout=SMTP_TIMEOUT)
+    print(f"{mail_queue.pending()} message(s) left in the spool")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Offline bulk upgrade of legacy plain-text passwords to bcrypt.
+
+Hashes every plain-text password in parallel across all cores and
+commits them in a single write, so no user pays for the upgrade on
+the login path. Safe to run while the app is up: an account whose
+password changed in the meantime is left alone.
+
+    python -m utils.migrate_passwords [--workers N] [--rounds R] [--dry-run]
+"""
+import argparse
+import sys
+import time
+
+from utils import hashing
+from utils.auth import get_user_store, is_password_hash
+
+PROGRESS_EVERY = 500
+
+
+def find_legacy_accounts(store):
+    """Return {username: plain-text password} for accounts not yet hashed"""
+    return {username: user['password'] for username, user in store.iter_users()
+            if user.get('password') and not is_password_hash(user['password'])}
+
+
+def migrate(workers=None, rounds=None, dry_run=False, out=sys.stdout):
+    store = get_user_store()
+    legacy = find_legacy_accounts(store)
+    total = len(legacy)
+    print(f"Found {total} account(s) with plain-text passwords", file=out)
+    if not total or dry_run:
+        return 0
+
+    start = time.perf_counter()
+    changes = {}
+    hashes = hashing.hash_many(legacy.values(), rounds=rounds, workers=workers)
+    for done, (username, new_hash) in enumerate(zip(legacy, hashes), 1):
+        changes[username] = (legacy[username], new_hash)
+        if done % PROGRESS_EVERY == 0 or done == total:
+            elapsed = time.perf_counter() - start
+            print(f"  hashed {done}/{total} ({done / elapsed:.1f} hashes/s)", file=out)
+
+    store.replace_passwords(changes)
+    elapsed = time.perf_counter() - start
+    print(f"Upgraded {total} password(s) in {elapsed:.1f}s "
+          f"({total / elapsed:.1f} accounts/s)", file=out)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hash all legacy plain-text passwords")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--rounds', type=int, default=None,
+                        help="bcrypt cost factor (default: ZTRAVELS_BCRYPT_ROUNDS)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only count the accounts that need upgrading")
+    args = parser.parse_args(argv)
+    migrate(workers=args.workers, rounds=args.rounds, dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
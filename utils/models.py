@@ -0,0 +1,141 @@
+"""
+Compact in-memory records for users and their bookings.
+
+The JSON user store keeps every booking in memory. A dict per booking
+pays for a hash table of ~16 keys each time; these models use __slots__
+instead, and intern the strings that repeat across thousands of
+bookings (cities, bus types, times, payment mode, status) so each is
+stored once. Bus and driver numbers are per trip, so they repeat too.
+
+Conversion is lossless both ways: a key missing from the dict leaves
+its slot unset (and to_dict() omits it again), and keys the model
+doesn't know are kept in `extra`. The models also answer .get(),
+[key] and `in` like the dicts they replace, so code written against
+the JSON shape keeps working; new code can use attributes.
+"""
+import sys
+
+_intern = sys.intern
+_UNSET = object()
+
+
+class _Record:
+    """Shared dict conversion and dict-style access for the models"""
+
+    __slots__ = ('extra',)
+
+    FIELDS = ()
+    INTERNED = frozenset()
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        fields = cls._field_set
+        interned = cls.INTERNED
+        extra = None
+        for key, value in data.items():
+            if key in fields:
+                if key in interned and type(value) is str:
+                    value = _intern(value)
+                setattr(record, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        record.extra = extra
+        return record
+
+    def to_dict(self):
+        data = {}
+        for key in self.FIELDS:
+            try:
+                data[key] = getattr(self, key)
+            except AttributeError:
+                pass
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key, default)
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, _Record):
+            other = other.to_dict()
+        return self.to_dict() == other if isinstance(other, dict) else NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Booking(_Record):
+    """One booking, as saved by the booking page"""
+
+    FIELDS = ('booking_id', 'from_city', 'to_city', 'date', 'departure_time',
+              'passengers', 'seats', 'bus_type', 'total_amount', 'discount',
+              'discount_code', 'bus_number', 'driver_number', 'payment_mode',
+              'booking_time', 'status')
+    # values shared by every booking on a trip, or by most bookings
+    INTERNED = frozenset({'from_city', 'to_city', 'date', 'departure_time', 'bus_type',
+                          'bus_number', 'driver_number', 'discount_code', 'payment_mode',
+                          'status'})
+    __slots__ = FIELDS
+    _field_set = frozenset(FIELDS)
+
+
+class User(_Record):
+    """An account; `bookings` holds Booking objects (or None tombstones)"""
+
+    FIELDS = ('email', 'password', 'phone', 'created_at', 'bookings')
+    __slots__ = FIELDS
+    _field_set = frozenset(FIELDS)
+
+    @classmethod
+    def from_dict(cls, data):
+        user = super().from_dict(data)
+        bookings = data.get('bookings')
+        if isinstance(bookings, list):
+            user.bookings = [None if b is None else Booking.from_dict(b) for b in bookings]
+        return user
+
+    def to_dict(self):
+        data = super().to_dict()
+        if 'bookings' in data:
+            data['bookings'] = [b.to_dict() for b in data['bookings'] if b is not None]
+        return data
+
+    def fields(self):
+        """Everything except the bookings, as a plain dict"""
+        data = super().to_dict()
+        data.pop('bookings', None)
+        return data
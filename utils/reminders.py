@@ -0,0 +1,229 @@
+"""
+Trip reminders for every booking that departs soon.
+
+Bookings are streamed from storage and filtered one at a time (for the
+JSON backend straight off users.json, without loading a UserStore), so
+memory stays flat however many bookings there are. Reminders are
+rendered with the compiled templates in utils.email_sender and sent by
+a few threads, each with its own pooled SMTP connection. The threads
+share a rate limit and are fed through a bounded queue. A send that
+fails is handed to the durable mail queue, which retries it.
+
+Each reminder sent is logged in SENT_LOG, so running the job again (for
+example from cron every 15 minutes) doesn't send a second one.
+
+    python -m utils.reminders [--hours 24] [--workers 4] [--rate 20] [--dry-run]
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from utils.auth import stream_bookings
+from utils.email_sender import REMINDER_EMAIL, booking_fields, build_message
+from utils.fileio import atomic_open, file_lock
+from utils.mail_queue import MAIL_WORKERS, PooledConnection, mail_configured, mail_queue, smtp_connect
+from utils.seats import holds_seats
+
+REMINDER_HOURS = 24
+SEND_RATE = float(os.environ.get('ZTRAVELS_MAIL_RATE', 20))   # messages per second
+SENT_LOG = 'reminders_sent.log'
+PROGRESS_EVERY = 100000
+
+
+def departure_datetime(booking):
+    """A booking's departure as a datetime, or None if it can't be parsed"""
+    try:
+        return datetime.strptime(f"{booking.get('date')} {booking.get('departure_time')}",
+                                 '%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return None
+
+
+def due_bookings(bookings, start, end):
+    """Filter (username, email, booking) to live bookings departing in [start, end)"""
+    for username, email, booking in bookings:
+        if not holds_seats(booking):
+            continue
+        departs = departure_datetime(booking)
+        if departs is not None and start <= departs < end:
+            yield username, email, booking, departs
+
+
+def load_sent_log(since):
+    """
+    Booking ids already reminded for departures at or after `since`.
+    Older lines are dropped from the log while it is read.
+    """
+    sent, stale = set(), 0
+    try:
+        with open(SENT_LOG, 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return sent
+    keep = []
+    for line in lines:
+        departs, _, booking_id = line.strip().partition(' ')
+        if booking_id and departs >= since.isoformat(timespec='minutes'):
+            sent.add(booking_id)
+            keep.append(line)
+        else:
+            stale += 1
+    if stale:
+        with file_lock(SENT_LOG), atomic_open(SENT_LOG) as f:
+            f.writelines(keep)
+    return sent
+
+
+class RateLimiter:
+    """Token bucket shared by the sender threads (`rate` per second)"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrentSender:
+    """
+    Sends messages from several threads, each with its own pooled SMTP
+    connection. submit() blocks once `backlog` messages are waiting, so a
+    fast producer can't pile messages up in memory.
+    """
+
+    def __init__(self, workers=MAIL_WORKERS, rate=SEND_RATE, connect=smtp_connect, backlog=None):
+        self._queue = queue.Queue(maxsize=backlog or workers * 8)
+        self._limiter = RateLimiter(rate)
+        self._connect = connect
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.deferred = 0
+        self._threads = [threading.Thread(target=self._work, name=f'reminder-sender-{i}', daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, recipient, message):
+        self._queue.put((recipient, message))
+
+    def _work(self):
+        connection = PooledConnection(self._connect)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                recipient, message = item
+                self._limiter.acquire()
+                try:
+                    connection.send(message['From'], [recipient], message.as_string())
+                except Exception:
+                    # the durable queue retries it with backoff
+                    mail_queue.enqueue(recipient, message)
+                    with self._lock:
+                        self.deferred += 1
+                else:
+                    with self._lock:
+                        self.sent += 1
+        finally:
+            connection.close()
+
+    def close(self):
+        """Wait for everything submitted to be sent (or deferred)"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def send_reminders(hours=REMINDER_HOURS, workers=MAIL_WORKERS, rate=SEND_RATE,
+                   dry_run=False, now=None, out=sys.stdout):
+    """
+    Remind every passenger departing in the next `hours` hours.
+    Returns (scanned, due, sent, deferred).
+    """
+    now = now or datetime.now()
+    already_sent = load_sent_log(now)
+
+    sender = None if dry_run else ConcurrentSender(workers=workers, rate=rate)
+    scanned = due = 0
+
+    def counted(bookings):
+        nonlocal scanned
+        for item in bookings:
+            scanned += 1
+            if scanned % PROGRESS_EVERY == 0:
+                print(f"  scanned {scanned} bookings, {due} due", file=out)
+            yield item
+
+    start = time.perf_counter()
+    log = None if dry_run else open(SENT_LOG, 'a', buffering=1)
+    try:
+        for username, email, booking, departs in due_bookings(counted(stream_bookings()),
+                                                              now, now + timedelta(hours=hours)):
+            booking_id = booking.get('booking_id')
+            if not email or booking_id in already_sent:
+                continue
+            due += 1
+            if dry_run:
+                continue
+            subject, text, html_body = REMINDER_EMAIL.render(booking_fields(email, booking))
+            sender.submit(email, build_message(email, subject, text, html_body))
+            already_sent.add(booking_id)
+            log.write(f"{departs.isoformat(timespec='minutes')} {booking_id}\n")
+    finally:
+        if sender is not None:
+            sender.close()
+        if log is not None:
+            log.close()
+
+    sent = sender.sent if sender else 0
+    deferred = sender.deferred if sender else 0
+    elapsed = time.perf_counter() - start
+    print(f"Scanned {scanned} bookings in {elapsed:.1f}s: {due} departing within {hours}h, "
+          f"{sent} reminded, {deferred} queued for retry", file=out)
+    return scanned, due, sent, deferred
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Email trip reminders for upcoming departures")
+    parser.add_argument('--hours', type=float, default=REMINDER_HOURS,
+                        help="remind bookings departing within this many hours (default 24)")
+    parser.add_argument('--workers', type=int, default=MAIL_WORKERS,
+                        help="concurrent SMTP connections")
+    parser.add_argument('--rate', type=float, default=SEND_RATE,
+                        help="max messages per second (0 = unlimited)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only count the reminders that would be sent")
+    args = parser.parse_args(argv)
+    if not args.dry_run and not mail_configured():
+        parser.error("set ZTRAVELS_SMTP_HOST to send reminders (or use --dry-run)")
+    send_reminders(hours=args.hours, workers=args.workers, rate=args.rate, dry_run=args.dry_run)
+    # deferred reminders are in the spool; give them their first retry now
+    if not args.dry_run and mail_queue.pending():
+        mail_queue.start()
+        mail_queue.drain()
+        mail_queue.stop()
+
+
+if __name__ == '__main__':
+    main()
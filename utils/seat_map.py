@@ -0,0 +1,35 @@
+"""
+Two-deck seat map as a single custom component.
+
+The whole 30-seat layout is drawn by frontend/seat_map/index.html from a
+few integers (sold/held/female bitmaps), instead of ~90 Streamlit
+elements. Seat clicks are handled in the browser; only the confirmed
+selection comes back to Python, so picking seats costs one rerun.
+"""
+import os
+
+import streamlit.components.v1 as components
+
+from utils.seats import TOTAL_SEATS, seats_to_mask
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'frontend', 'seat_map')
+_component = components.declare_component('seat_map', path=_FRONTEND_DIR)
+
+# Every 3rd seat is reserved for women
+FEMALE_MASK = seats_to_mask(range(3, TOTAL_SEATS + 1, 3))
+
+
+def seat_map(sold=(), held=(), selected=(), max_select=1, price=0,
+             show_men=True, show_women=True, key=None, on_change=None):
+    """
+    Render the seat map. Returns the last confirmed selection as
+    {'seats': [...], 'nonce': str}, or None if nothing was confirmed yet.
+    A new nonce means the user pressed "Confirm seats" again; `on_change`
+    (read the value from st.session_state[key]) runs once per press.
+    """
+    return _component(sold=seats_to_mask(sold), held=seats_to_mask(held),
+                      female=FEMALE_MASK, selected=sorted(selected),
+                      max_select=int(max_select), price=price,
+                      show_men=bool(show_men), show_women=bool(show_women),
+                      key=key, on_change=on_change, default=None)
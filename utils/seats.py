@@ -0,0 +1,215 @@
+"""
+Seat inventory per trip.
+
+A trip is (from_city, to_city, date, departure_time, bus_type) and its
+sold seats are a 30-bit bitmap (bit n-1 set = seat n sold). The user
+store keeps one SeatInventory in step with confirmed bookings, so
+the bookings on disk are the persistent record of what is sold.
+
+Seats a user has picked but not yet paid for are covered by short-lived
+holds (SeatHolds). Holds live in this process only, which is where all
+Streamlit sessions of one server run.
+"""
+import heapq
+import threading
+import time
+
+TOTAL_SEATS = 30
+FULL_MASK = (1 << TOTAL_SEATS) - 1
+
+
+def trip_key(from_city, to_city, date, departure_time, bus_type) -> str:
+    """Stable string key for a trip"""
+    return '|'.join(str(part) for part in (from_city, to_city, date, departure_time, bus_type))
+
+
+def booking_trip_key(booking: dict) -> str:
+    return trip_key(booking.get('from_city'), booking.get('to_city'), booking.get('date'),
+                    booking.get('departure_time'), booking.get('bus_type'))
+
+
+def seats_to_mask(seats) -> int:
+    mask = 0
+    for seat in seats:
+        seat = int(seat)
+        if 1 <= seat <= TOTAL_SEATS:
+            mask |= 1 << (seat - 1)
+    return mask
+
+
+def mask_to_seats(mask: int):
+    """Seat numbers set in a bitmap, in ascending order"""
+    seats = []
+    while mask:
+        low = mask & -mask
+        seats.append(low.bit_length())
+        mask ^= low
+    return seats
+
+
+def holds_seats(booking: dict) -> bool:
+    """Whether a booking occupies its seats (cancelled ones don't)"""
+    return 'cancel' not in str(booking.get('status', '') or '').lower()
+
+
+class SeatInventory:
+    """Sold-seat bitmaps keyed by trip_key()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sold = {}
+
+    def clear(self):
+        with self._lock:
+            self._sold = {}
+
+    def sold_mask(self, key) -> int:
+        return self._sold.get(key, 0)
+
+    def conflicts(self, key, seats):
+        """Seats from `seats` already sold on the trip"""
+        return mask_to_seats(self._sold.get(key, 0) & seats_to_mask(seats))
+
+    def mark(self, key, seats):
+        mask = seats_to_mask(seats)
+        with self._lock:
+            self._sold[key] = self._sold.get(key, 0) | mask
+
+    def release(self, key, seats):
+        mask = seats_to_mask(seats)
+        with self._lock:
+            remaining = self._sold.get(key, 0) & ~mask
+            if remaining:
+                self._sold[key] = remaining
+            else:
+                self._sold.pop(key, None)
+
+    def add_booking(self, booking):
+        if holds_seats(booking):
+            self.mark(booking_trip_key(booking), booking.get('seats', []))
+
+    def remove_booking(self, booking):
+        if holds_seats(booking):
+            self.release(booking_trip_key(booking), booking.get('seats', []))
+
+
+# How long a selected-but-unconfirmed seat stays reserved for its session
+HOLD_TTL_SECONDS = 600
+
+
+class SeatHolds:
+    """
+    Time-limited seat holds, one owner (browser session) per held seat.
+
+    Expiry times go into a single min-heap drained by one reaper thread,
+    which sleeps until the earliest deadline and then drops every hold
+    that has run out. Renewing or releasing a hold leaves its old heap
+    entry behind; the reaper skips entries that no longer match.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._holds = {}      # trip key -> {seat: (owner, expires_at)}
+        self._by_owner = {}   # owner -> {(trip key, seat)}
+        self._heap = []       # (expires_at, trip key, seat)
+        self._reaper = None
+
+    def hold(self, key, seats, owner, ttl=HOLD_TTL_SECONDS, unavailable=()):
+        """
+        Hold (or renew) all of `seats` for `owner`, or none of them.
+        Returns the seats that are sold, in `unavailable`, or held by
+        someone else (empty list on success).
+        """
+        if not seats:
+            return []
+        now = self._clock()
+        expires = now + ttl
+        with self._cond:
+            trip = self._holds.setdefault(key, {})
+            conflicts = []
+            for seat in seats:
+                current = trip.get(seat)
+                if seat in unavailable or (current and current[0] != owner and current[1] > now):
+                    conflicts.append(seat)
+            if conflicts:
+                if not trip:
+                    del self._holds[key]
+                return conflicts
+
+            owned = self._by_owner.setdefault(owner, set())
+            for seat in seats:
+                current = trip.get(seat)
+                if current and current[0] != owner:
+                    # Taking over an expired hold the reaper hasn't dropped yet
+                    self._drop(key, seat)
+                    trip = self._holds.setdefault(key, {})
+                trip[seat] = (owner, expires)
+                owned.add((key, seat))
+                heapq.heappush(self._heap, (expires, key, seat))
+            self._ensure_reaper()
+            self._cond.notify()
+            return []
+
+    def _drop(self, key, seat):
+        trip = self._holds.get(key)
+        if not trip or seat not in trip:
+            return
+        owner, _ = trip.pop(seat)
+        if not trip:
+            del self._holds[key]
+        owned = self._by_owner.get(owner)
+        if owned is not None:
+            owned.discard((key, seat))
+            if not owned:
+                del self._by_owner[owner]
+
+    def release(self, key, seats, owner):
+        """Release `owner`'s holds on some seats of a trip"""
+        with self._cond:
+            trip = self._holds.get(key, {})
+            for seat in seats:
+                if seat in trip and trip[seat][0] == owner:
+                    self._drop(key, seat)
+
+    def release_owner(self, owner):
+        """Release every hold belonging to `owner`"""
+        with self._cond:
+            for key, seat in list(self._by_owner.get(owner, ())):
+                if self._holds.get(key, {}).get(seat, (None,))[0] == owner:
+                    self._drop(key, seat)
+
+    def held_by_others(self, key, owner):
+        """Seats on a trip currently held by anyone but `owner`"""
+        now = self._clock()
+        with self._cond:
+            return {seat for seat, (holder, expires) in self._holds.get(key, {}).items()
+                    if holder != owner and expires > now}
+
+    def expire(self):
+        """Drop every hold whose deadline has passed"""
+        now = self._clock()
+        with self._cond:
+            self._expire(now)
+
+    def _expire(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            expires, key, seat = heapq.heappop(self._heap)
+            current = self._holds.get(key, {}).get(seat)
+            if current is not None and current[1] == expires:
+                self._drop(key, seat)
+
+    def _ensure_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap, name='seat-hold-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        with self._cond:
+            while True:
+                self._expire(self._clock())
+                timeout = self._heap[0][0] - self._clock() if self._heap else None
+                self._cond.wait(timeout)
+
+
+seat_holds = SeatHolds()
@@ -0,0 +1,308 @@
+"""
+SQLite storage backend for users and bookings.
+
+Enable with ZTRAVELS_STORAGE=sqlite (database path from ZTRAVELS_DB).
+Exposes the same interface as utils.auth.UserStore so the public
+functions in utils.auth work unchanged. Import existing data with:
+
+    python -m utils.sqlite_store migrate [users.json] [users.db]
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from utils.auth import HISTORY_PAGE_SIZE, HISTORY_SORTS, normalize_email
+from utils.models import Booking
+from utils.seats import booking_trip_key, holds_seats, mask_to_seats, seats_to_mask
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username   TEXT PRIMARY KEY,
+    email      TEXT NOT NULL,
+    -- normalize_email(email), computed in Python: SQLite's lower() and
+    -- trim() only fold ASCII letters and strip spaces
+    email_norm TEXT NOT NULL,
+    password   TEXT,
+    phone      TEXT,
+    created_at TEXT,
+    extra      TEXT
+);
+CREATE INDEX IF NOT EXISTS users_email_norm ON users(email_norm);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    booking_id TEXT,
+    username   TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_user ON bookings(username, id);
+CREATE INDEX IF NOT EXISTS bookings_booking_id ON bookings(booking_id);
+-- booking history by travel date (see bookings_page)
+CREATE INDEX IF NOT EXISTS bookings_user_travel ON bookings(
+    username, json_extract(data, '$.date'), json_extract(data, '$.departure_time'), id);
+
+CREATE TABLE IF NOT EXISTS trip_seats (
+    trip_key TEXT PRIMARY KEY,
+    sold     INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Bumped whenever existing databases need a data migration
+SCHEMA_VERSION = 1
+
+USER_COLUMNS = ('email', 'password', 'phone', 'created_at')
+
+# ORDER BY columns for each history sort; they match the bookings_user
+# and bookings_user_travel indexes
+_HISTORY_COLUMNS = {
+    'date': ("json_extract(data, '$.date')", "json_extract(data, '$.departure_time')", 'id'),
+    'booked': ('id',),
+}
+
+
+class SQLiteUserStore:
+    """
+    Users and bookings in SQLite (WAL mode).
+    Each thread gets its own connection; WAL lets readers run alongside
+    a writer, so concurrent Streamlit sessions don't queue on one file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self._rebuild_seats(conn)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    def invalidate(self):
+        """Nothing is cached outside SQLite itself"""
+
+    def _rebuild_seats(self, conn):
+        with conn:
+            conn.execute('DELETE FROM trip_seats')
+            for row in conn.execute('SELECT data FROM bookings'):
+                self._mark_seats(conn, json.loads(row['data']))
+
+    @staticmethod
+    def _mark_seats(conn, booking):
+        if holds_seats(booking):
+            conn.execute(
+                'INSERT INTO trip_seats (trip_key, sold) VALUES (?, ?) '
+                'ON CONFLICT(trip_key) DO UPDATE SET sold = sold | excluded.sold',
+                (booking_trip_key(booking), seats_to_mask(booking.get('seats', []))))
+
+    @staticmethod
+    def _release_seats(conn, booking):
+        if holds_seats(booking):
+            conn.execute('UPDATE trip_seats SET sold = sold & ~? WHERE trip_key = ?',
+                         (seats_to_mask(booking.get('seats', [])), booking_trip_key(booking)))
+
+    @staticmethod
+    def _user_from_row(row):
+        user = json.loads(row['extra']) if row['extra'] else {}
+        for col in USER_COLUMNS:
+            user[col] = row[col]
+        return user
+
+    def get(self, username):
+        """Return the user's fields (bookings are fetched via bookings())"""
+        row = self._conn().execute(
+            'SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        return self._user_from_row(row) if row else None
+
+    def username_for_email(self, email):
+        row = self._conn().execute(
+            'SELECT username FROM users WHERE email_norm = ? LIMIT 1',
+            (normalize_email(email),)).fetchone()
+        return row['username'] if row else None
+
+    def email_taken(self, email):
+        return self.username_for_email(email) is not None
+
+    def add_user(self, username, user, check_email=True):
+        """
+        Insert a user and their bookings; False if the username (or, with
+        check_email, the normalized email) is already taken.
+        """
+        user = dict(user)
+        bookings = user.pop('bookings', [])
+        extra = {k: v for k, v in user.items() if k not in USER_COLUMNS}
+        conn = self._conn()
+        try:
+            with conn:
+                # Take the write lock before the email check so the
+                # check and the insert happen atomically
+                conn.execute('BEGIN IMMEDIATE')
+                if check_email and self.username_for_email(user.get('email')) is not None:
+                    return False
+                conn.execute(
+                    'INSERT INTO users (username, email, email_norm, password, phone, '
+                    'created_at, extra) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (username, user.get('email', ''), normalize_email(user.get('email')),
+                     user.get('password'), user.get('phone'), user.get('created_at'),
+                     json.dumps(extra) if extra else None))
+                conn.executemany(
+                    'INSERT INTO bookings (booking_id, username, data) VALUES (?, ?, ?)',
+                    [(b.get('booking_id'), username, json.dumps(b)) for b in bookings])
+                for booking in bookings:
+                    self._mark_seats(conn, booking)
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def set_password(self, username, password):
+        with self._conn() as conn:
+            conn.execute('UPDATE users SET password = ? WHERE username = ?',
+                         (password, username))
+
+    def replace_passwords(self, changes):
+        """
+        Apply {username: (expected_old, new)} in one transaction.
+        Users whose password no longer matches expected_old are skipped.
+        """
+        with self._conn() as conn:
+            conn.executemany(
+                'UPDATE users SET password = ? WHERE username = ? AND password = ?',
+                [(new, username, old) for username, (old, new) in changes.items()])
+
+    def iter_users(self):
+        """Yield (username, user fields) for every user"""
+        for row in self._conn().execute('SELECT * FROM users ORDER BY username'):
+            yield row['username'], self._user_from_row(row)
+
+    def add_booking(self, username, booking):
+        """
+        Check the booking's seats are free and save it, atomically.
+        Returns (saved, seats_already_taken).
+        """
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if holds_seats(booking):
+                    row = conn.execute('SELECT sold FROM trip_seats WHERE trip_key = ?',
+                                       (booking_trip_key(booking),)).fetchone()
+                    taken = (row['sold'] if row else 0) & seats_to_mask(booking.get('seats', []))
+                    if taken:
+                        return False, mask_to_seats(taken)
+                conn.execute(
+                    'INSERT INTO bookings (booking_id, username, data) VALUES (?, ?, ?)',
+                    (booking.get('booking_id'), username, json.dumps(booking)))
+                self._mark_seats(conn, booking)
+        except sqlite3.IntegrityError:
+            # Unknown username (foreign key)
+            return False, []
+        return True, []
+
+    def remove_booking(self, username, booking_id):
+        """Cancel one booking; returns the removed Booking, or None"""
+        with self._conn() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, data FROM bookings WHERE username = ? AND booking_id = ? ORDER BY id LIMIT 1',
+                (username, booking_id)).fetchone()
+            if row is None:
+                return None
+            booking = json.loads(row['data'])
+            conn.execute('DELETE FROM bookings WHERE id = ?', (row['id'],))
+            self._release_seats(conn, booking)
+        return Booking.from_dict(booking)
+
+    def seat_mask(self, key):
+        """Bitmap of sold seats for a trip_key()"""
+        row = self._conn().execute(
+            'SELECT sold FROM trip_seats WHERE trip_key = ?', (key,)).fetchone()
+        return row['sold'] if row else 0
+
+    def find_booking(self, booking_id):
+        """Return (username, booking) for a booking ID, or None"""
+        row = self._conn().execute(
+            'SELECT username, data FROM bookings WHERE booking_id = ? ORDER BY id LIMIT 1',
+            (booking_id,)).fetchone()
+        return (row['username'], Booking.from_dict(json.loads(row['data']))) if row else None
+
+    def bookings(self, username):
+        rows = self._conn().execute(
+            'SELECT data FROM bookings WHERE username = ? ORDER BY id', (username,))
+        return [Booking.from_dict(json.loads(row['data'])) for row in rows]
+
+    def booking_count(self, username):
+        row = self._conn().execute(
+            'SELECT COUNT(*) FROM bookings WHERE username = ?', (username,)).fetchone()
+        return row[0]
+
+    def bookings_page(self, username, offset=0, limit=HISTORY_PAGE_SIZE, sort='date',
+                      descending=True):
+        """
+        One page of a user's bookings in `sort` order (see HISTORY_SORTS).
+        Returns (bookings, total). Both orders are served from an index.
+        """
+        if sort not in HISTORY_SORTS:
+            raise ValueError(f"unknown sort {sort!r}")
+        columns = _HISTORY_COLUMNS[sort]
+        direction = ' DESC' if descending else ''
+        rows = self._conn().execute(
+            f'SELECT data FROM bookings WHERE username = ? '
+            f'ORDER BY {", ".join(c + direction for c in columns)} LIMIT ? OFFSET ?',
+            (username, limit, offset))
+        return [Booking.from_dict(json.loads(row['data'])) for row in rows], self.booking_count(username)
+
+
+def migrate_json_to_sqlite(json_path='users.json', db_path='users.db'):
+    """
+    One-shot import of users.json (plus its journal) into SQLite.
+    Legacy accounts whose emails differ only by case or whitespace are
+    imported as they are; users whose username is already in the
+    database are skipped.
+    Returns (users_imported, bookings_imported, skipped_usernames).
+    """
+    from utils import auth
+
+    store = SQLiteUserStore(db_path)
+    imported = bookings = 0
+    skipped = []
+    # the journal that goes with json_path sits next to it
+    saved = auth.USERS_FILE, auth.JOURNAL_FILE
+    auth.USERS_FILE = json_path
+    auth.JOURNAL_FILE = os.path.splitext(json_path)[0] + '.journal'
+    try:
+        # hold the journal lock so a compaction can't swap files mid-import;
+        # users are read one at a time, so the import doesn't hold the whole file
+        with auth._journal_lock():
+            for username, user in auth.stream_users():
+                if store.add_user(username, user, check_email=False):
+                    imported += 1
+                    bookings += len(user.get('bookings', []))
+                else:
+                    skipped.append(username)
+    finally:
+        auth.USERS_FILE, auth.JOURNAL_FILE = saved
+    return imported, bookings, skipped
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print(__doc__)
+        sys.exit(1)
+    src = sys.argv[2] if len(sys.argv) > 2 else 'users.json'
+    dst = sys.argv[3] if len(sys.argv) > 3 else 'users.db'
+    n_users, n_bookings, skipped = migrate_json_to_sqlite(src, dst)
+    print(f"Migrated {n_users} users and {n_bookings} bookings into {dst}")
+    if skipped:
+        more = f" and {len(skipped) - 20} more" if len(skipped) > 20 else ""
+        print(f"Skipped {len(skipped)} users already in {dst}: {', '.join(skipped[:20])}{more}")